@@ -1,6 +1,7 @@
 from django.contrib import admin
 
 from .models import Address
+from .models import GeocodingJob
 
 
 # Register your models here.
@@ -16,3 +17,20 @@ class AddressAdmin(admin.ModelAdmin):
         'updated_at',
     ]
     empty_value_display = '---'
+
+
+@admin.register(GeocodingJob)
+class GeocodingJobAdmin(admin.ModelAdmin):
+    search_fields = [
+        'address',
+    ]
+    list_display = [
+        'address',
+        'status',
+        'attempts',
+        'run_after',
+        'created_at',
+    ]
+    list_filter = [
+        'status',
+    ]
@@ -0,0 +1,116 @@
+import random
+import time
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from addressesapp.models import Address, GeocodingJob
+from restaurateur.geocoder import CircuitOpenError, is_client_error
+from restaurateur.utils import fetch_coordinates
+
+
+class Command(BaseCommand):
+    help = 'Geocode addresses from the queue of geocoding jobs. Several workers can run at once.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10, help='jobs taken by one transaction')
+        parser.add_argument('--sleep', type=float, default=2.0, help='seconds to wait when the queue is empty')
+        parser.add_argument('--max-attempts', type=int, default=5, help='attempts before the job is failed')
+        parser.add_argument('--backoff', type=float, default=10.0, help='base delay in seconds between attempts')
+        parser.add_argument('--lease', type=float, default=60.0,
+                            help='seconds jobs are taken by the worker, after that other workers can take them')
+        parser.add_argument('--once', action='store_true', help='drain the queue and exit')
+
+    def handle(self, *args, **options):
+        while True:
+            processed = self.process_batch(
+                options['batch_size'], options['max_attempts'], options['backoff'], options['lease'],
+            )
+            if processed:
+                self.stdout.write(f'processed {processed} jobs')
+                continue
+            if options['once']:
+                return
+            time.sleep(options['sleep'])
+
+    def process_batch(self, batch_size, max_attempts, backoff, lease):
+        jobs = self.claim_jobs(batch_size, lease)
+        # geocoder is requested out of transaction, so no rows are locked while it answers
+        for job in jobs:
+            self.process_job(job, max_attempts, backoff)
+        return len(jobs)
+
+    def claim_jobs(self, batch_size, lease):
+        """
+        Take due jobs by moving their run_after forward by :lease: seconds.
+
+        Other workers don't see taken jobs, if the worker dies the jobs are due again after the lease.
+        """
+        with transaction.atomic():
+            # locked jobs are being taken by other workers
+            jobs = list(
+                GeocodingJob.objects.due()
+                .select_for_update(skip_locked=True)
+                .order_by('run_after')[:batch_size]
+            )
+            leased_until = timezone.now() + timedelta(seconds=lease)
+            GeocodingJob.objects.filter(pk__in=[job.pk for job in jobs]).update(run_after=leased_until)
+        return jobs
+
+    def process_job(self, job, max_attempts, backoff):
+        try:
+            coordinates = fetch_coordinates(settings.YANDEX_GEO_APIKEY, job.address)
+        except CircuitOpenError as error:
+            # geocoder is down, the job is not to blame, so the attempt is not counted
+            self.reschedule_job(job, error, settings.GEOCODER_CIRCUIT_RESET_TIMEOUT)
+            return
+        except requests.exceptions.RequestException as error:
+            if is_client_error(error):
+                # the same as on the order board: address is unknown for the geocoder
+                coordinates = None
+            else:
+                self.postpone_job(job, error, max_attempts, backoff)
+                return
+
+        job.attempts += 1
+        lat, lon = None, None
+        if coordinates is not None:
+            lon, lat = coordinates
+        with transaction.atomic():
+            Address.objects.update_or_create(
+                address=job.address,
+                defaults={
+                    'lat': lat,
+                    'lon': lon,
+                    'updated_at': timezone.now(),
+                }
+            )
+            job.status = GeocodingJob.DONE
+            job.last_error = ''
+            job.save()
+
+    def postpone_job(self, job, error, max_attempts, backoff):
+        job.attempts += 1
+        if job.attempts >= max_attempts:
+            job.status = GeocodingJob.FAILED
+            job.last_error = describe_error(error)
+            job.save()
+        else:
+            self.reschedule_job(job, error, backoff * 2 ** (job.attempts - 1))
+
+    def reschedule_job(self, job, error, delay):
+        job.last_error = describe_error(error)
+        job.run_after = timezone.now() + timedelta(seconds=delay * random.uniform(1, 1.5))
+        job.save()
+
+
+def describe_error(error):
+    """Class of the error and HTTP status, text of requests errors has URL with apikey of the geocoder."""
+    response = getattr(error, 'response', None)
+    if response is not None:
+        return f'{type(error).__name__}: HTTP {response.status_code}'
+    return type(error).__name__
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 
 # Create your models here.
@@ -26,3 +27,76 @@ class Address(models.Model):
     class Meta:
         verbose_name = 'адрес'
         verbose_name_plural = 'адреса'
+
+
+class GeocodingJobQuerySet(models.QuerySet):
+    def enqueue(self, addresses, refresh=False):
+        """
+        Add jobs for addresses which are not geocoded yet.
+
+        With :refresh: addresses are geocoded again even if they are known, finished jobs are restarted.
+        """
+        addresses = set(addresses)
+        if not refresh:
+            addresses -= set(Address.objects.filter(address__in=addresses).values_list('address', flat=True))
+        jobs = [GeocodingJob(address=address) for address in addresses]
+        # job for the same address can be already in the queue
+        self.bulk_create(jobs, ignore_conflicts=True)
+        if refresh:
+            self.filter(address__in=addresses).exclude(status=GeocodingJob.PENDING).update(
+                status=GeocodingJob.PENDING,
+                attempts=0,
+                run_after=timezone.now(),
+            )
+
+    def due(self):
+        return self.filter(status=GeocodingJob.PENDING, run_after__lte=timezone.now())
+
+
+class GeocodingJob(models.Model):
+    PENDING = 'pending'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Ожидает'),
+        (DONE, 'Выполнено'),
+        (FAILED, 'Ошибка'),
+    ]
+
+    address = models.CharField(
+        'адрес',
+        max_length=200,
+        unique=True,
+    )
+    status = models.CharField(
+        'статус',
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+    )
+    attempts = models.PositiveSmallIntegerField(
+        'попыток',
+        default=0,
+    )
+    run_after = models.DateTimeField(
+        'выполнить после',
+        default=timezone.now,
+        db_index=True,
+    )
+    last_error = models.TextField(
+        'последняя ошибка',
+        blank=True,
+    )
+    created_at = models.DateTimeField(
+        'дата создания',
+        default=timezone.now,
+    )
+
+    objects = GeocodingJobQuerySet.as_manager()
+
+    def __str__(self):
+        return f'{self.address} ({self.status})'
+
+    class Meta:
+        verbose_name = 'задача геокодирования'
+        verbose_name_plural = 'задачи геокодирования'
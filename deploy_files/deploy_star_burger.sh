@@ -10,11 +10,15 @@ echo "frontend ok"
 ./venv/bin/python -m pip install -r requirements.txt
 ./venv/bin/python manage.py collectstatic --noinput
 ./venv/bin/python manage.py migrate --noinput
+./venv/bin/python manage.py createcachetable
 echo "backend ok"
+cp deploy_files/starburger-geocoder.service /etc/systemd/system/
 systemctl daemon-reload
+systemctl enable starburger-geocoder
 systemctl reload nginx
 systemctl stop starburger-backend
 systemctl start starburger-backend
+systemctl restart starburger-geocoder
 echo "systemctl start ok"
 last_commit_hash=$(git rev-parse HEAD)
 echo $last_commit_hash
@@ -5,6 +5,7 @@ from django.templatetags.static import static
 from django.utils.html import format_html
 from django.utils.http import url_has_allowed_host_and_scheme
 
+from .events import publish_order_event
 from .models import Order
 from .models import OrderProduct
 from .models import Product
@@ -134,15 +135,31 @@ class OrderAdmin(admin.ModelAdmin):
         'contact_phone',
         'status',
         'payment_type',
+        'total',
     ]
     list_filter = [
         'status',
         'payment_type',
     ]
+    readonly_fields = [
+        'total',
+    ]
     inlines = [
         OrderProductInline
     ]
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if not change or {'status', 'responsible_restaurant'} & set(form.changed_data):
+            publish_order_event()
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # products are saved after order, so total is recalculated here
+        order = form.instance
+        order.total = order.calculate_total()
+        order.save(update_fields=['total', 'updated_at'])
+
     def response_post_save_change(self, request, obj):
         res = super().response_post_save_change(request, obj)
         if 'next' in request.GET and url_has_allowed_host_and_scheme(request.GET['next'], None):
@@ -162,3 +179,17 @@ class OrderProductAdmin(admin.ModelAdmin):
     @admin.display(description='id')
     def order_pk(self, obj):
         return obj.order.pk
+
+    def save_model(self, request, obj, form, change):
+        previous_order_id = form.initial.get('order')
+        super().save_model(request, obj, form, change)
+        Order.objects.filter(pk__in={obj.order_id, previous_order_id}).update_totals()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        Order.objects.filter(pk=obj.order_id).update_totals()
+
+    def delete_queryset(self, request, queryset):
+        order_ids = set(queryset.values_list('order_id', flat=True))
+        super().delete_queryset(request, queryset)
+        Order.objects.filter(pk__in=order_ids).update_totals()
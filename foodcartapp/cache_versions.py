@@ -0,0 +1,17 @@
+import uuid
+
+from django.core.cache import cache
+
+RESTAURANTS = 'restaurants'
+MENU = 'menu'
+CATALOG = 'catalog'
+
+
+def get_cache_version(name):
+    """Return current version of data group, caches built from the data should be keyed by it."""
+    return cache.get_or_set(f'cache_version:{name}', lambda: uuid.uuid4().hex, timeout=None)
+
+
+def bump_cache_version(name):
+    # random value, so version changes even if the previous one was evicted from cache
+    cache.set(f'cache_version:{name}', uuid.uuid4().hex, timeout=None)
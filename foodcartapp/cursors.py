@@ -0,0 +1,15 @@
+import base64
+import json
+
+
+def encode_cursor(values):
+    """Encode list of json-serializable values to url-safe string."""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Decode list of values from cursor, raise ValueError if cursor is broken."""
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (TypeError, ValueError) as error:
+        raise ValueError(f'Broken cursor: {cursor}') from error
@@ -0,0 +1,39 @@
+import threading
+
+from django.db import transaction
+
+
+class OrderEventBroker:
+    """
+    In-process notifications about created and changed orders.
+
+    Subscribers are woken up by events of their process only,
+    so they should also check db for changes made by other processes.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._last_event_id = 0
+
+    @property
+    def last_event_id(self):
+        return self._last_event_id
+
+    def publish(self):
+        with self._condition:
+            self._last_event_id += 1
+            self._condition.notify_all()
+
+    def wait(self, last_seen_event_id, timeout):
+        """Wait for event newer than :last_seen_event_id: not longer than :timeout: seconds."""
+        with self._condition:
+            self._condition.wait_for(lambda: self._last_event_id > last_seen_event_id, timeout)
+            return self._last_event_id
+
+
+order_events = OrderEventBroker()
+
+
+def publish_order_event():
+    """Notify subscribers after commit, so they find the change in db."""
+    transaction.on_commit(order_events.publish)
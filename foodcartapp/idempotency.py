@@ -0,0 +1,95 @@
+import hashlib
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+
+def reserve_idempotency_key(key, request_hash):
+    """
+    Save the key before request is processed, return the record and whether it is reserved by this request.
+
+    Unique constraint makes only one of concurrent requests with the same key reserve it.
+    The record is committed at once, so other requests see it while this one is processed.
+    Key of request not finished in IDEMPOTENCY_KEY_LOCK_TIMEOUT seconds may be reserved again.
+    """
+    ttl = timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+    lock_timeout = timedelta(seconds=settings.IDEMPOTENCY_KEY_LOCK_TIMEOUT)
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(key=key, request_hash=request_hash), True
+        except IntegrityError:
+            pass
+        try:
+            record = IdempotencyKey.objects.get(key=key)
+        except IdempotencyKey.DoesNotExist:
+            # released by failed request in the meantime
+            continue
+        keys = IdempotencyKey.objects.filter(pk=record.pk)
+        if not (keys.expired(ttl) | keys.stale(lock_timeout)).delete()[0]:
+            return record, False
+    # key is reserved and released by other requests all the time, treat it as being processed
+    return IdempotencyKey(key=key, request_hash=request_hash), False
+
+
+def idempotent(view):
+    """
+    Make POST view safe to retry with `Idempotency-Key` header.
+
+    The first request with a key is processed and its response is stored for IDEMPOTENCY_KEY_TTL seconds.
+    Retry with the same key, path and body gets the stored response without processing,
+    the key used with other body or while the first request is processed gets an error.
+    If the view fails, the key is released, so the request can be retried.
+    Should be put under `api_view`.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if key is None:
+            return view(request, *args, **kwargs)
+        if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            return Response(
+                {'detail': f'Idempotency-Key должен быть от 1 до {IDEMPOTENCY_KEY_MAX_LENGTH} символов.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        # keys are shared by endpoints, the same body sent to other endpoint is other request
+        request_hash = hashlib.sha256(request.path.encode() + b'\n' + request.body).hexdigest()
+        record, is_reserved = reserve_idempotency_key(key, request_hash)
+        if not is_reserved:
+            if record.request_hash != request_hash:
+                return Response(
+                    {'detail': 'Idempotency-Key уже использован для другого запроса.'},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                )
+            if record.response_status is None:
+                return Response(
+                    {'detail': 'Запрос с этим Idempotency-Key ещё обрабатывается.'},
+                    status=status.HTTP_409_CONFLICT,
+                )
+            return Response(record.response_data, status=record.response_status)
+
+        # the key may be reserved again by other request if this one is not finished in time
+        reserved_keys = IdempotencyKey.objects.filter(pk=record.pk, response_status=None)
+        try:
+            response = view(request, *args, **kwargs)
+        except BaseException:
+            reserved_keys.delete()
+            raise
+        if not status.is_success(response.status_code):
+            reserved_keys.delete()
+            return response
+        reserved_keys.update(
+            response_status=response.status_code,
+            response_data=response.data,
+        )
+        return response
+    return wrapper
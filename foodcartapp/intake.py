@@ -0,0 +1,151 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from addressesapp.models import GeocodingJob
+from .events import publish_order_event
+from .models import Order
+
+logger = logging.getLogger(__name__)
+
+
+class OrderIntakeTimeout(Exception):
+    """Order was not taken for commit in time, it won't be created."""
+
+
+def notify_about_orders(orders):
+    """Start work which follows creation of orders, should be called after commit."""
+    # geocode addresses in background, manager will see distances without waiting the geocoder
+    GeocodingJob.objects.enqueue([order.address for order in orders])
+    publish_order_event()
+
+
+def register_orders(orders_data):
+    """Create orders from validated data of OrderSerializer in one transaction."""
+    with transaction.atomic():
+        orders = Order.objects.register(orders_data)
+        transaction.on_commit(lambda: notify_about_orders(orders))
+    return orders
+
+
+class OrderIntake:
+    """
+    Buffer of orders which are committed by background thread in groups.
+
+    Group is committed when it has :batch_size: orders or :flush_interval: seconds after its first order came,
+    so concurrent requests share one transaction instead of waiting for a transaction each.
+    Request waits not longer than :timeout: seconds for its order to be taken for commit,
+    the order being committed is waited for till the end, so the request doesn't fail with the order created.
+    """
+
+    def __init__(self, batch_size, flush_interval, timeout=None):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self._pending = []
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def submit(self, order_data):
+        """Put validated order into buffer and wait until it's committed, return created order."""
+        future = Future()
+        with self._condition:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='order-intake', daemon=True)
+                self._thread.start()
+            self._pending.append((order_data, future))
+            self._condition.notify()
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # order which is not taken by the thread yet won't be committed
+            if future.cancel():
+                raise OrderIntakeTimeout(f'order is not taken for commit in {self.timeout} s')
+        # the order is being committed, the thread sets the result whatever happens
+        return future.result()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending)
+                deadline = time.monotonic() + self.flush_interval
+                while len(self._pending) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                batch = self._pending[:self.batch_size]
+                self._pending = self._pending[self.batch_size:]
+            # orders of requests which stopped waiting are dropped
+            batch = [(order_data, future) for order_data, future in batch if future.set_running_or_notify_cancel()]
+            try:
+                self._flush(batch)
+            except Exception as error:
+                # the thread should keep serving other requests
+                logger.exception('Group of %s orders is not flushed', len(batch))
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        close_old_connections()
+        try:
+            orders = self._commit([order_data for order_data, _ in batch])
+        except Exception:
+            logger.exception('Group of %s orders is not committed, orders are committed one by one', len(batch))
+            # one broken order should not fail orders of other requests
+            for order_data, future in batch:
+                self._flush_one(order_data, future)
+            return
+        for (_, future), order in zip(batch, orders):
+            future.set_result(order)
+        self._notify(orders)
+
+    def _flush_one(self, order_data, future):
+        try:
+            order, = self._commit([order_data])
+        except Exception as error:
+            future.set_exception(error)
+            return
+        future.set_result(order)
+        self._notify([order])
+
+    def _commit(self, orders_data):
+        with transaction.atomic():
+            return Order.objects.register(orders_data)
+
+    def _notify(self, orders):
+        # orders are committed already, failure here must not make them be created again
+        try:
+            notify_about_orders(orders)
+        except Exception:
+            logger.exception('Orders %s are committed, but geocoding and board are not notified',
+                             [order.id for order in orders])
+
+
+_order_intake = None
+_order_intake_lock = threading.Lock()
+
+
+def get_order_intake():
+    """
+    Return intake of the process configured by ORDER_INTAKE_BATCH_SIZE, ORDER_INTAKE_FLUSH_INTERVAL
+    and ORDER_INTAKE_TIMEOUT.
+    """
+    global _order_intake
+
+    with _order_intake_lock:
+        if _order_intake is None:
+            _order_intake = OrderIntake(
+                batch_size=settings.ORDER_INTAKE_BATCH_SIZE,
+                flush_interval=settings.ORDER_INTAKE_FLUSH_INTERVAL / 1000,
+                timeout=settings.ORDER_INTAKE_TIMEOUT,
+            )
+        return _order_intake
@@ -0,0 +1,120 @@
+import time
+import tracemalloc
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.http import JsonResponse
+from django.test import RequestFactory
+from django.test.utils import override_settings
+
+from foodcartapp import renderers
+from foodcartapp.cache_versions import CATALOG, bump_cache_version
+from foodcartapp.models import Product
+from foodcartapp.views import product_list_api
+
+
+def generate_products(products_count):
+    """Items shaped like product_list_api ones."""
+    for number in range(products_count):
+        yield {
+            'id': number,
+            'name': f'Бургер №{number}',
+            'price': Decimal('350.00'),
+            'special_status': number % 5 == 0,
+            'description': 'Сочная котлета из мраморной говядины, сыр чеддер, томаты и фирменный соус. ' * 3,
+            'category': {
+                'id': number % 7,
+                'name': 'Бургеры',
+            },
+            'image': f'/media/burger_{number}.jpg',
+            'restaurant': {
+                'id': number,
+                'name': f'Бургер №{number}',
+            },
+        }
+
+
+def render_with_json_response(products_count):
+    """The way product_list_api rendered catalog before: list of items dumped by JsonResponse with indent."""
+    response = JsonResponse(list(generate_products(products_count)), safe=False, json_dumps_params={
+        'ensure_ascii': False,
+        'indent': 4,
+    })
+    return len(response.content)
+
+
+def render_by_chunks(products_count, pretty=False):
+    return sum(len(chunk) for chunk in renderers.iter_json_array(generate_products(products_count), pretty))
+
+
+def request_product_list(accept_encoding, is_cached):
+    """Get catalog from product_list_api, with cache miss the payload is built and compressed again."""
+    if not is_cached:
+        bump_cache_version(CATALOG)
+    request = RequestFactory().get('/api/products/', HTTP_ACCEPT_ENCODING=accept_encoding)
+    return len(product_list_api(request).content)
+
+
+def measure(function, *args):
+    started_at = time.perf_counter()
+    size = function(*args)
+    elapsed = time.perf_counter() - started_at
+
+    tracemalloc.start()
+    function(*args)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak_memory, size
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare time, peak memory and size of catalog JSON rendered by JsonResponse and by chunks, '
+        'then measure product_list_api with products of the database'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000],
+                            help='numbers of products')
+
+    def handle(self, *args, **options):
+        orjson = renderers.orjson
+        ways = [('JsonResponse', render_with_json_response, None)]
+        if orjson is not None:
+            ways.append(('orjson', render_by_chunks, orjson))
+            ways.append(('orjson pretty', lambda count: render_by_chunks(count, pretty=True), orjson))
+        ways.append(('json', render_by_chunks, None))
+        ways.append(('json pretty', lambda count: render_by_chunks(count, pretty=True), None))
+
+        self.stdout.write(f'{"products":>8} {"way":>14} {"time, s":>10} {"peak, MB":>10} {"size, KB":>10}')
+        try:
+            for products_count in options['sizes']:
+                for way, render, encoder in ways:
+                    renderers.orjson = encoder
+                    elapsed, peak_memory, size = measure(render, products_count)
+                    self.stdout.write(
+                        f'{products_count:>8} {way:>14} {elapsed:>10.3f} '
+                        f'{peak_memory / 1024 / 1024:>10.1f} {size / 1024:>10.0f}'
+                    )
+        finally:
+            renderers.orjson = orjson
+
+        # versions are bumped to miss the cache, so the cache of the site is not touched
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'benchmark_api_rendering',
+        }}):
+            self.measure_product_list_api()
+
+    def measure_product_list_api(self):
+        """Whole request: query, rendering by chunks, compression and caching of payload, or cached payload only."""
+        self.stdout.write(f'\nproduct_list_api, {Product.objects.count()} products of the database')
+        self.stdout.write(f'{"cache":>8} {"encoding":>14} {"time, s":>10} {"peak, MB":>10} {"size, KB":>10}')
+        for is_cached in [False, True]:
+            for accept_encoding in ['identity', 'gzip', 'br']:
+                request_product_list(accept_encoding, is_cached=False)
+                elapsed, peak_memory, size = measure(request_product_list, accept_encoding, is_cached)
+                self.stdout.write(
+                    f'{"hit" if is_cached else "miss":>8} {accept_encoding:>14} {elapsed:>10.3f} '
+                    f'{peak_memory / 1024 / 1024:>10.1f} {size / 1024:>10.1f}'
+                )
@@ -0,0 +1,74 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils.functional import cached_property
+from rest_framework.utils.serializer_helpers import BindingDict
+
+from foodcartapp.models import Product
+from foodcartapp.serializers import OrderSerializer
+
+
+class LegacyOrderSerializer(OrderSerializer):
+    """OrderSerializer with the way MapFieldsModelSerializer built fields before they were compiled per class."""
+
+    @cached_property
+    def fields(self):
+        fields = BindingDict(self)
+        for key, value in self.get_fields().items():
+            fields[self.field_name_map[key]] = value
+        return fields
+
+    @property
+    def validated_data_source(self):
+        if not hasattr(self, '_validated_data_source'):
+            reverse_field_name_map = {value: key for key, value in self.field_name_map.items()}
+            new_validated_data = {}
+            for key, value in self._validated_data.items():
+                new_validated_data[reverse_field_name_map[key]] = value
+            self._validated_data_source = new_validated_data
+        return self._validated_data_source
+
+
+def setup_serializer(serializer_class, payload):
+    serializer = serializer_class(data=payload)
+    return serializer.fields
+
+
+def validate_order(serializer_class, payload):
+    serializer = serializer_class(data=payload)
+    serializer.is_valid(raise_exception=True)
+    return serializer.validated_data_source
+
+
+class Command(BaseCommand):
+    help = 'Compare per-request overhead of OrderSerializer with fields built per instance and compiled per class'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='serializers created by every way')
+        parser.add_argument('--cart-size', type=int, default=15, help='line items in order')
+
+    def handle(self, *args, **options):
+        product_ids = list(Product.objects.values_list('id', flat=True)[:options['cart_size']])
+        if not product_ids:
+            self.stderr.write('add products to the database first')
+            return
+        payload = {
+            'firstname': 'Иван',
+            'lastname': 'Петров',
+            'phonenumber': '+79001234567',
+            'address': 'Москва, Красная площадь, 1',
+            'products': [
+                {'product': product_ids[number % len(product_ids)], 'quantity': 1}
+                for number in range(options['cart_size'])
+            ],
+        }
+
+        self.stdout.write(f'{"stage":>10} {"way":>10} {"per request, ms":>16}')
+        for stage, run in [('setup', setup_serializer), ('validation', validate_order)]:
+            for way, serializer_class in [('legacy', LegacyOrderSerializer), ('compiled', OrderSerializer)]:
+                run(serializer_class, payload)
+                started_at = time.perf_counter()
+                for _ in range(options['requests']):
+                    run(serializer_class, payload)
+                elapsed = time.perf_counter() - started_at
+                self.stdout.write(f'{stage:>10} {way:>10} {elapsed / options["requests"] * 1000:>16.3f}')
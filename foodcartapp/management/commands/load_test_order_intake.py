@@ -0,0 +1,85 @@
+import statistics
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from addressesapp.models import GeocodingJob
+from foodcartapp.intake import OrderIntake, register_orders
+from foodcartapp.models import Order, Product
+
+LOAD_TEST_ADDRESS = 'Load test order'
+
+
+def run_clients(register, order_data, orders_count, concurrency):
+    """Register orders from :concurrency: threads, return elapsed seconds and latencies of requests."""
+    latencies = []
+    latencies_lock = threading.Lock()
+
+    def client(client_orders_count):
+        client_latencies = []
+        try:
+            for _ in range(client_orders_count):
+                started_at = time.perf_counter()
+                register(order_data)
+                client_latencies.append(time.perf_counter() - started_at)
+        finally:
+            connection.close()
+        with latencies_lock:
+            latencies.extend(client_latencies)
+
+    clients = [
+        threading.Thread(target=client, args=(orders_count // concurrency + (number < orders_count % concurrency),))
+        for number in range(concurrency)
+    ]
+    started_at = time.perf_counter()
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    return time.perf_counter() - started_at, latencies
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare throughput and latency of order registration with transaction per order and with group commit. '
+        'Orders are written to the database and deleted afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1000, help='orders registered by every way')
+        parser.add_argument('--concurrency', type=int, default=16, help='clients registering orders at once')
+        parser.add_argument('--batch-size', type=int, default=20, help='orders committed by one group')
+        parser.add_argument('--flush-interval', type=float, default=5.0, help='ms to wait for the group to fill')
+
+    def handle(self, *args, **options):
+        products = list(Product.objects.available()[:3])
+        if not products:
+            self.stderr.write('add available products to the database first')
+            return
+        order_data = {
+            'address': LOAD_TEST_ADDRESS,
+            'first_name': 'Load',
+            'last_name': 'Test',
+            'contact_phone': '+79001234567',
+            'products': [{'product': product, 'quantity': 1} for product in products],
+        }
+        intake = OrderIntake(options['batch_size'], options['flush_interval'] / 1000, settings.ORDER_INTAKE_TIMEOUT)
+
+        self.stdout.write(f'{"way":>14} {"orders/s":>10} {"p50, ms":>10} {"p99, ms":>10}')
+        try:
+            for way, register in [
+                ('per request', lambda data: register_orders([data])),
+                ('group commit', intake.submit),
+            ]:
+                elapsed, latencies = run_clients(register, order_data, options['orders'], options['concurrency'])
+                percentiles = statistics.quantiles(latencies, n=100)
+                self.stdout.write(
+                    f'{way:>14} {len(latencies) / elapsed:>10.0f} '
+                    f'{percentiles[49] * 1000:>10.1f} {percentiles[98] * 1000:>10.1f}'
+                )
+        finally:
+            Order.objects.filter(address=LOAD_TEST_ADDRESS).delete()
+            GeocodingJob.objects.filter(address=LOAD_TEST_ADDRESS).delete()
@@ -0,0 +1,14 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from foodcartapp.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = 'Delete idempotency keys older than IDEMPOTENCY_KEY_TTL seconds'
+
+    def handle(self, *args, **options):
+        deleted, _ = IdempotencyKey.objects.expired(timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)).delete()
+        self.stdout.write(f'deleted {deleted} idempotency keys')
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.15 on 2026-10-18 16:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0051_order_total'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('status', 'S60_COMPLETED'), _negated=True), fields=['status', '-created_at', 'id'], name='order_board_idx'),
+        ),
+    ]
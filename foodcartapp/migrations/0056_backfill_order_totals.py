@@ -0,0 +1,34 @@
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+BATCH_SIZE = 1000
+
+
+def fill_order_totals(apps, schema_editor):
+    Order = apps.get_model('foodcartapp', 'Order')
+    OrderProduct = apps.get_model('foodcartapp', 'OrderProduct')
+    products_total = (
+        OrderProduct.objects
+        .filter(order=OuterRef('pk'))
+        .values('order')
+        .annotate(total=Sum(F('price') * F('quantity')))
+        .values('total')
+    )
+    # only total is updated, so the orders don't look changed for the order board
+    order_ids = list(Order.objects.filter(total=0).order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(order_ids), BATCH_SIZE):
+        Order.objects.filter(pk__in=order_ids[start:start + BATCH_SIZE]).update(
+            total=Coalesce(Subquery(products_total), Value(0), output_field=models.DecimalField()),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0055_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.RunPython(code=fill_order_totals, reverse_code=migrations.RunPython.noop),
+    ]
@@ -1,6 +1,10 @@
-from django.db import models
+from collections import defaultdict
+
+from django.db import connections, models
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator
-from django.db.models import F, Sum
+from django.db.models import Count, Exists, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from phonenumber_field.modelfields import PhoneNumberField
 
@@ -30,13 +34,40 @@ class Restaurant(models.Model):
 
 
 class ProductQuerySet(models.QuerySet):
-    def available(self):
-        products = (
+    def available(self, restaurant_id=None):
+        """Products which can be ordered, in the given restaurant if :restaurant_id: is passed."""
+        menu_items = RestaurantMenuItem.objects.filter(product=OuterRef('pk'), availability=True)
+        if restaurant_id is not None:
+            menu_items = menu_items.filter(restaurant_id=restaurant_id)
+        return self.filter(Exists(menu_items))
+
+    def for_catalog(self, category_id=None, restaurant_id=None, special_status=None, after_id=None):
+        """Available products ordered by id for keyset pagination, page starts after :after_id:."""
+        products = self.available(restaurant_id).order_by('id')
+        if category_id is not None:
+            products = products.filter(category_id=category_id)
+        if special_status is not None:
+            products = products.filter(special_status=special_status)
+        if after_id is not None:
+            products = products.filter(id__gt=after_id)
+        return products
+
+    def get_available_restaurants(self):
+        """
+        Return dict of product id to list of (id, name) of restaurants which have the product available.
+
+        Computed by one query for all products, restaurants are sorted by name.
+        """
+        menu_items = (
             RestaurantMenuItem.objects
-            .filter(availability=True)
-            .values_list('product')
+            .filter(product__in=self.order_by().values('pk'), availability=True)
+            .order_by('restaurant__name', 'restaurant_id')
+            .values_list('product_id', 'restaurant_id', 'restaurant__name')
         )
-        return self.filter(pk__in=products)
+        restaurants = defaultdict(list)
+        for product_id, restaurant_id, restaurant_name in menu_items:
+            restaurants[product_id].append((restaurant_id, restaurant_name))
+        return dict(restaurants)
 
 
 class ProductCategory(models.Model):
@@ -91,6 +122,10 @@ class Product(models.Model):
     class Meta:
         verbose_name = 'товар'
         verbose_name_plural = 'товары'
+        indexes = [
+            # pages of catalog filtered by category
+            models.Index(fields=['category', 'id'], name='product_category_catalog_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -126,14 +161,114 @@ class RestaurantMenuItem(models.Model):
         unique_together = [
             ['restaurant', 'product']
         ]
+        indexes = [
+            # lookup of available products
+            models.Index(fields=['product', 'availability'], name='menu_item_availability_idx'),
+        ]
 
     def __str__(self):
         return f"{self.restaurant.name} - {self.product.name}"
 
 
 class OrderQuerySet(models.QuerySet):
-    def with_price(self):
-        return self.prefetch_related('products').annotate(price=Sum(F('products__price') * F('products__quantity')))
+    def register(self, orders_data):
+        """
+        Create orders with their products, return created orders.
+
+        :orders_data: are validated data of OrderSerializer. All orders are inserted by one statement
+        and all their products by another one, call it in transaction.
+        """
+        orders = [
+            Order(
+                address=order_data['address'],
+                first_name=order_data['first_name'],
+                last_name=order_data['last_name'],
+                contact_phone=order_data['contact_phone'],
+                total=sum(product['product'].price * product['quantity'] for product in order_data['products']),
+            )
+            for order_data in orders_data
+        ]
+        if connections[self.db].features.can_return_rows_from_bulk_insert:
+            self.bulk_create(orders)
+        else:
+            # ids of inserted orders are unknown after bulk insert, e.g. on SQLite
+            for order in orders:
+                order.save(force_insert=True, using=self.db)
+
+        OrderProduct.objects.using(self.db).bulk_create(
+            OrderProduct(
+                order=order,
+                product=product['product'],
+                quantity=product['quantity'],
+                price=product['product'].price,
+            )
+            for order, order_data in zip(orders, orders_data)
+            for product in order_data['products']
+        )
+        return orders
+
+    def for_board(self):
+        """Not completed orders in order of manager board, see index `order_board_idx`."""
+        return self.exclude(status=Order.COMPLETED).order_by('status', '-created_at', 'id')
+
+    def changed_after(self, updated_at, order_id):
+        """Orders changed after the given one, in order of changes."""
+        return self.filter(
+            Q(updated_at__gt=updated_at)
+            | Q(updated_at=updated_at, id__gt=order_id)
+        ).order_by('updated_at', 'id')
+
+    def after(self, status, created_at, order_id):
+        """Orders placed after the given one on manager board, for keyset pagination."""
+        return self.filter(
+            Q(status__gt=status)
+            | Q(status=status, created_at__lt=created_at)
+            | Q(status=status, created_at=created_at, id__gt=order_id)
+        )
+
+    def update_totals(self):
+        """Recalculate stored totals of orders by their products with one query."""
+        products_total = (
+            OrderProduct.objects
+            .filter(order=OuterRef('pk'))
+            .values('order')
+            .annotate(total=Sum(F('price') * F('quantity')))
+            .values('total')
+        )
+        return self.update(
+            total=Coalesce(Subquery(products_total), Value(0), output_field=models.DecimalField()),
+            updated_at=timezone.now(),
+        )
+
+    def get_candidate_restaurant_ids(self):
+        """
+        Return dict of order id to ids of restaurants which can cook all products of order.
+
+        Computed by one grouped query: restaurant fits the order if it has as many available products of order
+        as there are different products in order. Orders without such restaurants are not in the dict.
+        """
+        products_count = (
+            OrderProduct.objects
+            .filter(order=OuterRef('order'))
+            .values('order')
+            .annotate(count=Count('product', distinct=True))
+            .values('count')
+        )
+        candidates = (
+            OrderProduct.objects
+            .filter(order__in=self, product__menu_items__availability=True)
+            .values('order', 'product__menu_items__restaurant')
+            .annotate(
+                available_products_count=Count('product', distinct=True),
+                products_count=Subquery(products_count),
+            )
+            .filter(available_products_count=F('products_count'))
+            .values_list('order', 'product__menu_items__restaurant')
+        )
+        restaurant_ids = defaultdict(list)
+        for order_id, restaurant_id in candidates:
+            restaurant_ids[order_id].append(restaurant_id)
+        return dict(restaurant_ids)
 
 
 class Order(models.Model):
@@ -202,6 +337,11 @@ class Order(models.Model):
         null=True,
         blank=True,
     )
+    updated_at = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True,
+        db_index=True,
+    )
     payment_type = models.CharField(
         'способ оплаты',
         max_length=50,
@@ -216,29 +356,34 @@ class Order(models.Model):
         null=True,
         blank=True,
     )
+    total = models.DecimalField(
+        'стоимость заказа',
+        max_digits=10,
+        decimal_places=2,
+        default=0,
+        validators=[MinValueValidator(0)],
+    )
     objects = OrderQuerySet.as_manager()
 
     @property
     def client_name(self):
         return f'{self.last_name} {self.first_name}'
 
-    def get_available_restaurants(self):
-        restaurants = None
-        for product in self.products.all():
-            product_restaurants = {menuitem.restaurant for menuitem in product.available_restaurants() if
-                                   menuitem.availability}
-            if restaurants is None:
-                restaurants = product_restaurants
-            elif not restaurants:
-                return []
-            else:
-                restaurants &= product_restaurants
-
-        return list(restaurants)
+    def calculate_total(self):
+        total = self.products.aggregate(total=Sum(F('price') * F('quantity')))['total']
+        return total or 0
 
     class Meta:
         verbose_name = 'заказ'
         verbose_name_plural = 'заказы'
+        indexes = [
+            # manager board shows only not completed orders
+            models.Index(
+                fields=['status', '-created_at', 'id'],
+                name='order_board_idx',
+                condition=~Q(status='S60_COMPLETED'),
+            ),
+        ]
 
     def __str__(self):
         return f'{self.pk}, {self.last_name} {self.first_name}, {self.address} ({self.status})'
@@ -268,12 +413,56 @@ class OrderProduct(models.Model):
         validators=[MinValueValidator(0)]
     )
 
-    def available_restaurants(self):
-        return self.product.menu_items.all()
-
     class Meta:
         verbose_name = 'товар в заказе'
         verbose_name_plural = 'товары в заказе'
 
     def __str__(self):
         return f'Заказ {self.order.pk}, {self.product} ({self.quantity} шт.) по {self.price} руб.'
+
+
+class IdempotencyKeyQuerySet(models.QuerySet):
+    def expired(self, ttl):
+        return self.filter(created_at__lt=timezone.now() - ttl)
+
+    def stale(self, lock_timeout):
+        """Keys of requests which are not finished in :lock_timeout:, e.g. process was killed."""
+        return self.filter(response_status=None, created_at__lt=timezone.now() - lock_timeout)
+
+
+class IdempotencyKey(models.Model):
+    key = models.CharField(
+        'ключ',
+        max_length=255,
+        unique=True,
+    )
+    request_hash = models.CharField(
+        'хэш запроса',
+        max_length=64,
+    )
+    response_status = models.PositiveSmallIntegerField(
+        'код ответа',
+        null=True,
+        blank=True,
+        help_text='пусто, пока запрос обрабатывается',
+    )
+    response_data = models.JSONField(
+        'данные ответа',
+        encoder=DjangoJSONEncoder,
+        null=True,
+        blank=True,
+    )
+    created_at = models.DateTimeField(
+        'создан',
+        default=timezone.now,
+        db_index=True,
+    )
+
+    objects = IdempotencyKeyQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'ключ идемпотентности'
+        verbose_name_plural = 'ключи идемпотентности'
+
+    def __str__(self):
+        return self.key
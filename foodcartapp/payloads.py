@@ -0,0 +1,157 @@
+import hashlib
+import time
+import zlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import quote_etag
+
+from .cache_versions import CATALOG, get_cache_version
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+IDENTITY = 'identity'
+GZIP = 'gzip'
+BROTLI = 'br'
+
+# preferred encodings go first, they are chosen when client accepts several with the same quality
+ENCODINGS_PREFERENCE = [BROTLI, GZIP, IDENTITY]
+
+# payload is compressed on the request path, higher qualities take seconds for large catalog
+# and give no smaller output for JSON
+BROTLI_QUALITY = 5
+# only one request builds the payload, others wait for it up to PAYLOAD_BUILD_WAIT seconds
+PAYLOAD_BUILD_LOCK_TIMEOUT = 60
+PAYLOAD_BUILD_WAIT = 5
+PAYLOAD_BUILD_POLL_INTERVAL = 0.05
+
+
+def compress_payload(chunks):
+    """
+    Return {encoding: (body, etag)} with plain body and all compressed variants the server can make.
+
+    Body is taken by chunks, they are compressed as they come, but all variants are held in memory whole:
+    chunked encoding saves memory only while the payload is built on cache miss, response is never streamed.
+    """
+    digest = hashlib.sha256()
+    plain_chunks, gzip_chunks, brotli_chunks = [], [], []
+    # gzip container with zero mtime, so compressed bytes are the same for the same body
+    gzip_compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    brotli_compressor = brotli.Compressor(quality=BROTLI_QUALITY) if brotli is not None else None
+    for chunk in chunks:
+        digest.update(chunk)
+        plain_chunks.append(chunk)
+        gzip_chunks.append(gzip_compressor.compress(chunk))
+        if brotli_compressor is not None:
+            brotli_chunks.append(brotli_compressor.process(chunk))
+    gzip_chunks.append(gzip_compressor.flush())
+
+    digest = digest.hexdigest()
+    variants = {
+        IDENTITY: (b''.join(plain_chunks), digest),
+        GZIP: (b''.join(gzip_chunks), f'{digest}-{GZIP}'),
+    }
+    if brotli_compressor is not None:
+        brotli_chunks.append(brotli_compressor.finish())
+        variants[BROTLI] = (b''.join(brotli_chunks), f'{digest}-{BROTLI}')
+    return variants
+
+
+def get_catalog_payload(name, build_payload):
+    """
+    Return payload of API response with compressed variants of its body.
+
+    :build_payload: returns chunks of the body and dict of response headers.
+    Payload is kept in cache until products, categories or menus are changed,
+    so compression is paid once per catalog version, not per request.
+    Cached body is sent by HttpResponse as a whole.
+    Concurrent requests for the missed payload wait while the first one builds it, `cache.add` is the lock.
+    """
+    cache_key = f'api_payload:{name}:{get_cache_version(CATALOG)}'
+    payload = cache.get(cache_key)
+    if payload is not None:
+        return payload
+
+    lock_key = f'{cache_key}:lock'
+    is_locked = cache.add(lock_key, True, PAYLOAD_BUILD_LOCK_TIMEOUT)
+    if not is_locked:
+        deadline = time.monotonic() + PAYLOAD_BUILD_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(PAYLOAD_BUILD_POLL_INTERVAL)
+            payload = cache.get(cache_key)
+            if payload is not None:
+                return payload
+        # the building request is too slow or died, answer without waiting more
+
+    try:
+        chunks, headers = build_payload()
+        payload = {
+            'variants': compress_payload(chunks),
+            'headers': headers,
+        }
+        cache.set(cache_key, payload, settings.CATALOG_CACHE_TTL)
+    finally:
+        if is_locked:
+            cache.delete(lock_key)
+    return payload
+
+
+def parse_accept_encoding(header):
+    """Return {encoding: quality} from Accept-Encoding header."""
+    qualities = {}
+    for coding in header.split(','):
+        name, *params = [part.strip() for part in coding.split(';')]
+        if not name:
+            continue
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name.lower()] = quality
+    return qualities
+
+
+def choose_encoding(accept_encoding, available_encodings):
+    qualities = parse_accept_encoding(accept_encoding)
+    default_quality = qualities.get('*', 0.0)
+    best_encoding, best_quality = IDENTITY, 0.0
+    for encoding in ENCODINGS_PREFERENCE:
+        if encoding == IDENTITY or encoding not in available_encodings:
+            continue
+        quality = qualities.get(encoding, default_quality)
+        if quality > best_quality:
+            best_encoding, best_quality = encoding, quality
+    return best_encoding
+
+
+def payload_response(request, payload, content_type='application/json'):
+    """
+    Respond with variant of cached payload accepted by client.
+
+    Request with If-None-Match of this variant gets 304 without body.
+    """
+    variants = payload['variants']
+    encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''), variants)
+    body, etag = variants[encoding]
+    etag = quote_etag(etag)
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(body, content_type=content_type)
+        if encoding != IDENTITY:
+            response['Content-Encoding'] = encoding
+    for header, value in payload['headers'].items():
+        response[header] = value
+    response['ETag'] = etag
+    patch_vary_headers(response, ['Accept-Encoding'])
+    patch_cache_control(response, public=True, max_age=settings.CATALOG_MAX_AGE)
+    return response
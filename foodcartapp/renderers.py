@@ -0,0 +1,69 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+CHUNK_SIZE = 64 * 1024
+
+
+def encode_default(obj):
+    # the same representation of Decimal, dates and UUID as JsonResponse gives
+    return DjangoJSONEncoder().default(obj)
+
+
+def dumps(data, pretty=False):
+    """
+    Encode data to JSON bytes with orjson if it's installed, pretty output is indented.
+
+    Output is the same with both encoders: orjson can indent only by 2 spaces, so json does so too.
+    """
+    if orjson is not None:
+        option = orjson.OPT_INDENT_2 if pretty else 0
+        return orjson.dumps(data, default=encode_default, option=option)
+    if pretty:
+        return json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False, indent=2).encode()
+    return json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def get_indent(pretty):
+    return b'  ' if pretty else b''
+
+
+def iter_json_array(items, pretty=False, chunk_size=CHUNK_SIZE):
+    """
+    Encode items to JSON array by chunks of about :chunk_size: bytes.
+
+    Items are encoded one by one, so neither list of items nor the whole JSON is held in memory.
+    Output is the same as of `dumps(list(items), pretty)`.
+    Catalog API joins the chunks into cached payload, so they save memory only while the cache is filled.
+    """
+    indent = get_indent(pretty)
+    buffer, buffer_size = [b'['], 1
+    is_empty = True
+    for item in items:
+        encoded_item = dumps(item, pretty)
+        if pretty:
+            encoded_item = b'\n' + b'\n'.join(indent + line for line in encoded_item.split(b'\n'))
+        if not is_empty:
+            encoded_item = b',' + encoded_item
+        is_empty = False
+
+        buffer.append(encoded_item)
+        buffer_size += len(encoded_item)
+        if buffer_size >= chunk_size:
+            yield b''.join(buffer)
+            buffer, buffer_size = [], 0
+
+    if pretty and not is_empty:
+        buffer.append(b'\n')
+    buffer.append(b']')
+    yield b''.join(buffer)
+
+
+def is_pretty_requested(request):
+    return request.GET.get('pretty') in ('1', 'true')
+
@@ -1,13 +1,40 @@
+import copy
 from collections import OrderedDict
+from collections.abc import Mapping
 
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.utils.functional import cached_property
+from rest_framework import serializers
 from rest_framework.fields import SkipField
-from rest_framework.relations import PKOnlyObject
+from rest_framework.relations import PKOnlyObject, PrimaryKeyRelatedField
 from rest_framework.serializers import ModelSerializer
 from rest_framework.utils.serializer_helpers import BindingDict
 
+from .cursors import decode_cursor, encode_cursor
 from .models import Order
 from .models import OrderProduct
+from .models import Product
+
+# fields of product_list_api items, in order of output
+PRODUCT_CATALOG_FIELDS = [
+    'id', 'name', 'price', 'special_status', 'description', 'category', 'image', 'restaurants',
+]
+
+
+def encode_product_cursor(product_id):
+    return encode_cursor([product_id])
+
+
+def decode_product_cursor(cursor):
+    """Decode id of the last product of the previous page, raise ValueError if cursor is broken."""
+    try:
+        product_id, = decode_cursor(cursor)
+    except (TypeError, ValueError) as error:
+        raise ValueError(f'Broken cursor: {cursor}') from error
+    if not isinstance(product_id, int):
+        raise ValueError(f'Broken cursor: {cursor}')
+    return product_id
 
 
 class MapFieldsModelSerializer(ModelSerializer):
@@ -17,20 +44,33 @@ class MapFieldsModelSerializer(ModelSerializer):
     It useful when frontend keys different from field names of models.
     It needs :field_name_map: dict, which keys are source field names and values is custom names.
 
-    Also, to get validated_data with source field names, you should use validated_data_source
+    Fields are built and renamed once per class, instances only bind copies of them.
+    Renamed fields get source field name as `source`, so validated_data has source field names,
+    validated_data_source is kept as its alias.
     """
     field_name_map = {}
 
+    @classmethod
+    def compile_fields(cls, serializer):
+        """Return {custom name: (source name, field)}, it's built by the first instance of the class."""
+        # checked in class dict, so subclasses don't share fields of the parent
+        compiled_fields = cls.__dict__.get('_compiled_fields')
+        if compiled_fields is None:
+            compiled_fields = {
+                cls.field_name_map[source]: (source, field)
+                for source, field in serializer.get_fields().items()
+            }
+            cls._compiled_fields = compiled_fields
+        return compiled_fields
+
     @cached_property
     def fields(self):
-        """
-        Replace source names to custom.
-
-        Method can not use super method, super will raise with KeyError.
-        """
         fields = BindingDict(self)
-        for key, value in self.get_fields().items():
-            fields[self.field_name_map[key]] = value
+        for field_name, (source, field) in self.compile_fields(self).items():
+            field = copy.deepcopy(field)
+            if field_name != source:
+                field.source = source
+            fields[field_name] = field
         return fields
 
     @property
@@ -38,16 +78,51 @@ class MapFieldsModelSerializer(ModelSerializer):
         if not hasattr(self, '_validated_data'):
             msg = 'You must call `.is_valid()` before accessing `.validated_data`.'
             raise AssertionError(msg)
-        if not hasattr(self, '_validated_data_source'):
-            reverse_field_name_map = {value: key for key, value in self.field_name_map.items()}
-            new_validated_data = {}
-            for key, value in self._validated_data.items():
-                new_validated_data[reverse_field_name_map[key]] = value
-            self._validated_data_source = new_validated_data
-        return self._validated_data_source
+        return self._validated_data
+
+
+class BulkPrimaryKeyRelatedField(PrimaryKeyRelatedField):
+    """
+    Primary key field which takes objects from dict loaded by the parent serializer in advance.
+
+    Parent puts {pk: object} into context by :bulk_context_key:, so list of items is validated
+    without query per item. Without the dict it works as PrimaryKeyRelatedField.
+    """
+    bulk_context_key = 'related_objects'
+
+    def to_internal_value(self, data):
+        objects = self.context.get(self.bulk_context_key)
+        if objects is None:
+            return super().to_internal_value(data)
+        if self.pk_field is not None:
+            data = self.pk_field.to_internal_value(data)
+        try:
+            if isinstance(data, bool):
+                raise TypeError
+            pk = self.get_queryset().model._meta.pk.to_python(data)
+        except (TypeError, ValueError, DjangoValidationError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if pk not in objects:
+            self.fail('does_not_exist', pk_value=data)
+        return objects[pk]
+
+    @classmethod
+    def load_objects(cls, queryset, pks):
+        """Return {pk: object} for all valid pks by one query, invalid ones are left to the field to report."""
+        valid_pks = set()
+        for pk in pks:
+            if isinstance(pk, bool):
+                continue
+            try:
+                valid_pks.add(queryset.model._meta.pk.to_python(pk))
+            except (TypeError, ValueError, DjangoValidationError):
+                continue
+        return queryset.in_bulk(valid_pks) if valid_pks else {}
 
 
 class OrderProductSerializer(ModelSerializer):
+    serializer_related_field = BulkPrimaryKeyRelatedField
+
     class Meta:
         model = OrderProduct
         fields = ['product', 'quantity']
@@ -66,3 +141,78 @@ class OrderSerializer(MapFieldsModelSerializer):
     class Meta:
         model = Order
         fields = ['address', 'first_name', 'last_name', 'contact_phone', 'products']
+
+    @classmethod
+    def get_products_context(cls, orders):
+        """
+        Return context with products of all raw :orders: loaded by one query.
+
+        Serializers of these orders created with the context don't query products.
+        """
+        product_ids = []
+        for order in orders:
+            products = order.get('products') if isinstance(order, Mapping) else None
+            if isinstance(products, list):
+                product_ids.extend(
+                    item['product'] for item in products if isinstance(item, Mapping) and 'product' in item
+                )
+        return {
+            BulkPrimaryKeyRelatedField.bulk_context_key: BulkPrimaryKeyRelatedField.load_objects(
+                Product.objects.all(),
+                product_ids,
+            ),
+        }
+
+    def to_internal_value(self, data):
+        # products of all items are loaded by one query before items are validated
+        if BulkPrimaryKeyRelatedField.bulk_context_key not in self.context:
+            self.context.update(self.get_products_context([data]))
+        return super().to_internal_value(data)
+
+
+class ProductCatalogParamsSerializer(serializers.Serializer):
+    """Query parameters of product_list_api."""
+    category = serializers.IntegerField(required=False, min_value=1)
+    restaurant = serializers.IntegerField(required=False, min_value=1)
+    special = serializers.BooleanField(required=False, allow_null=True, default=None)
+    limit = serializers.IntegerField(required=False, min_value=1, max_value=settings.CATALOG_PAGE_SIZE_MAX)
+    cursor = serializers.CharField(required=False)
+    fields = serializers.CharField(required=False)
+
+    def validate_cursor(self, value):
+        try:
+            return decode_product_cursor(value)
+        except ValueError:
+            raise serializers.ValidationError('Неверная ссылка на страницу.')
+
+    def validate_fields(self, value):
+        fields = {field.strip() for field in value.split(',') if field.strip()}
+        unknown_fields = fields - set(PRODUCT_CATALOG_FIELDS)
+        if unknown_fields:
+            raise serializers.ValidationError(f'Неизвестные поля: {", ".join(sorted(unknown_fields))}.')
+        if not fields:
+            raise serializers.ValidationError('Укажите хотя бы одно поле.')
+        return [field for field in PRODUCT_CATALOG_FIELDS if field in fields]
+
+    def get_query_params(self, **changes):
+        """Return validated parameters in canonical form, they identify catalog page."""
+        params = {**self.validated_data, **changes}
+        query_params = {}
+        for name in ['category', 'restaurant', 'limit']:
+            if params.get(name) is not None:
+                query_params[name] = params[name]
+        if params.get('special') is not None:
+            query_params['special'] = int(params['special'])
+        if params.get('cursor') is not None:
+            query_params['cursor'] = encode_product_cursor(params['cursor'])
+        if params.get('fields') is not None:
+            query_params['fields'] = ','.join(params['fields'])
+        return query_params
+
+    def filter(self, products):
+        return products.for_catalog(
+            category_id=self.validated_data.get('category'),
+            restaurant_id=self.validated_data.get('restaurant'),
+            special_status=self.validated_data.get('special'),
+            after_id=self.validated_data.get('cursor'),
+        )
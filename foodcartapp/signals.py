@@ -0,0 +1,28 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache_versions import CATALOG, MENU, RESTAURANTS, bump_cache_version
+from .models import Product, ProductCategory, Restaurant, RestaurantMenuItem
+
+# versions are bumped after commit, otherwise concurrent request could cache old data under the new version
+
+
+@receiver([post_save, post_delete], sender=Restaurant)
+def bump_restaurants_version(sender, **kwargs):
+    transaction.on_commit(partial(bump_cache_version, RESTAURANTS))
+
+
+@receiver([post_save, post_delete], sender=RestaurantMenuItem)
+def bump_menu_version(sender, **kwargs):
+    transaction.on_commit(partial(bump_cache_version, MENU))
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=ProductCategory)
+@receiver([post_save, post_delete], sender=Restaurant)
+@receiver([post_save, post_delete], sender=RestaurantMenuItem)
+def bump_catalog_version(sender, **kwargs):
+    transaction.on_commit(partial(bump_cache_version, CATALOG))
@@ -0,0 +1,303 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .intake import OrderIntake, OrderIntakeTimeout
+from .models import IdempotencyKey, Order, Product, ProductCategory, Restaurant, RestaurantMenuItem
+
+
+def create_menu(products_count):
+    """Create products available in one restaurant."""
+    category = ProductCategory.objects.create(name='Бургеры')
+    restaurant = Restaurant.objects.create(name='Star Burger', address='Москва, Тверская 1')
+    products = [
+        Product.objects.create(name=f'Бургер №{number}', category=category, price=100 + number, image='burger.jpg')
+        for number in range(products_count)
+    ]
+    RestaurantMenuItem.objects.bulk_create([
+        RestaurantMenuItem(restaurant=restaurant, product=product) for product in products
+    ])
+    return products
+
+
+def make_order(products):
+    return {
+        'products': products,
+        'firstname': 'Иван',
+        'lastname': 'Петров',
+        'phonenumber': '+79001234567',
+        'address': 'Москва, Тверская 2',
+    }
+
+
+class RegisterOrderTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = create_menu(20)
+
+    def post_order(self, products):
+        return self.client.post('/api/order/', json.dumps(make_order(products)), content_type='application/json')
+
+    def test_queries_do_not_grow_with_cart(self):
+        for products_count in [1, 15, 20]:
+            # geocoding of address is queued after commit, it's counted too
+            with self.subTest(products_count=products_count), self.assertNumQueries(7), \
+                    self.captureOnCommitCallbacks(execute=True):
+                response = self.post_order([
+                    {'product': product.id, 'quantity': 2} for product in self.products[:products_count]
+                ])
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(Order.objects.count(), 3)
+        self.assertEqual(Order.objects.order_by('id').last().products.count(), 20)
+
+    def test_product_errors(self):
+        cases = [
+            (9999, 'Недопустимый первичный ключ "9999" - объект не существует.'),
+            ('abc', 'Некорректный тип. Ожидалось значение первичного ключа, получен str.'),
+            (True, 'Некорректный тип. Ожидалось значение первичного ключа, получен bool.'),
+            ([1], 'Некорректный тип. Ожидалось значение первичного ключа, получен list.'),
+        ]
+        for product_id, error in cases:
+            with self.subTest(product_id=product_id):
+                response = self.post_order([{'product': product_id, 'quantity': 1}])
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'products': [{'product': [error]}]})
+        self.assertFalse(Order.objects.exists())
+
+
+class RegisterOrdersBatchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = create_menu(5)
+
+    def post_orders(self, orders):
+        return self.client.post('/api/orders/batch/', json.dumps({'orders': orders}), content_type='application/json')
+
+    def test_valid_orders_are_created_and_invalid_get_errors(self):
+        response = self.post_orders([
+            make_order([{'product': self.products[0].id, 'quantity': 1}]),
+            make_order([{'product': 9999, 'quantity': 1}]),
+            {**make_order([{'product': self.products[1].id, 'quantity': 2}]), 'phonenumber': 'not a phone'},
+            make_order([{'product': self.products[2].id, 'quantity': 3}]),
+        ])
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['orders']
+        self.assertEqual([set(result) for result in results], [
+            {'id', 'order'}, {'errors'}, {'errors'}, {'id', 'order'},
+        ])
+        self.assertIn('products', results[1]['errors'])
+        self.assertIn('phonenumber', results[2]['errors'])
+        self.assertEqual(
+            list(Order.objects.order_by('id').values_list('id', flat=True)),
+            [results[0]['id'], results[3]['id']],
+        )
+        self.assertEqual(Order.objects.get(pk=results[3]['id']).total, self.products[2].price * 3)
+
+    @override_settings(ORDER_BATCH_MAX_SIZE=3)
+    def test_orders_limit(self):
+        order = make_order([{'product': self.products[0].id, 'quantity': 1}])
+        response = self.post_orders([order] * 4)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('orders', response.json())
+        self.assertFalse(Order.objects.exists())
+
+        self.assertEqual(self.post_orders([order] * 3).status_code, 200)
+        self.assertEqual(Order.objects.count(), 3)
+
+    def test_not_list_of_orders(self):
+        for data in [{}, {'orders': []}, {'orders': 'order'}, []]:
+            with self.subTest(data=data):
+                response = self.client.post('/api/orders/batch/', json.dumps(data), content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+
+    def test_products_are_loaded_by_one_query(self):
+        orders = [
+            make_order([{'product': product.id, 'quantity': 1} for product in self.products[:number + 1]])
+            for number in range(5)
+        ]
+        with CaptureQueriesContext(connection) as context:
+            response = self.post_orders(orders)
+        self.assertEqual(response.status_code, 200)
+        products_queries = [
+            query['sql'] for query in context.captured_queries
+            if query['sql'].startswith('SELECT') and 'FROM "foodcartapp_product"' in query['sql']
+        ]
+        self.assertEqual(len(products_queries), 1)
+
+
+@override_settings(IDEMPOTENCY_KEY_LOCK_TIMEOUT=60)
+class IdempotencyKeyTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = create_menu(2)
+
+    def setUp(self):
+        self.order = make_order([{'product': self.products[0].id, 'quantity': 1}])
+
+    def post(self, data, key='key', url='/api/order/'):
+        return self.client.post(url, json.dumps(data), content_type='application/json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_gets_stored_response(self):
+        response = self.post(self.order)
+        self.assertEqual(response.status_code, 200)
+        retry = self.post(self.order)
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.json(), response.json())
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_other_key_is_other_request(self):
+        self.post(self.order)
+        self.post(self.order, key='other key')
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_key_with_other_body(self):
+        self.post(self.order)
+        response = self.post({**self.order, 'address': 'Москва, Тверская 3'})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_key_with_other_endpoint(self):
+        self.post({'orders': [self.order]}, url='/api/orders/batch/')
+        response = self.post({'orders': [self.order]}, url='/api/order/')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_key_of_request_in_progress(self):
+        self.post(self.order)
+        IdempotencyKey.objects.update(response_status=None, response_data=None)
+        response = self.post(self.order)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_key_of_request_not_finished_in_time_is_taken_again(self):
+        self.post(self.order)
+        IdempotencyKey.objects.update(
+            response_status=None,
+            response_data=None,
+            created_at=timezone.now() - timedelta(seconds=61),
+        )
+        response = self.post(self.order)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(IdempotencyKey.objects.get().response_status, 200)
+
+    def test_failed_request_releases_key(self):
+        response = self.post(make_order([]))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.post(self.order).status_code, 200)
+
+    @override_settings(ORDER_INTAKE_GROUP_COMMIT=True)
+    def test_intake_timeout_releases_key(self):
+        with mock.patch('foodcartapp.views.get_order_intake') as get_order_intake:
+            get_order_intake.return_value.submit.side_effect = OrderIntakeTimeout
+            response = self.post(self.order)
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_broken_key(self):
+        for key in ['', 'k' * 256]:
+            with self.subTest(key_length=len(key)):
+                self.assertEqual(self.post(self.order, key=key).status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+
+class StubOrderIntake(OrderIntake):
+    """Intake which commits orders slowly and without db."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.commits = []
+        self.commit_started = threading.Event()
+        self.commit_allowed = threading.Event()
+
+    def _commit(self, orders_data):
+        self.commits.append(orders_data)
+        self.commit_started.set()
+        self.commit_allowed.wait(5)
+        return [SimpleNamespace(id=len(self.commits), address=order_data['address']) for order_data in orders_data]
+
+
+class OrderIntakeTest(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch('foodcartapp.intake.notify_about_orders')
+        self.notify_about_orders = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_order_committed_after_timeout_is_waited_for(self):
+        intake = StubOrderIntake(batch_size=1, flush_interval=0, timeout=0.05)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            submitted = executor.submit(intake.submit, make_order([]))
+            self.assertTrue(intake.commit_started.wait(5))
+            time.sleep(0.1)
+            intake.commit_allowed.set()
+            order = submitted.result(5)
+        self.assertEqual(order.id, 1)
+        self.assertEqual(len(intake.commits), 1)
+        self.notify_about_orders.assert_called_once_with([order])
+
+    def test_order_not_taken_in_time_is_not_committed(self):
+        intake = StubOrderIntake(batch_size=2, flush_interval=0.3, timeout=0.05)
+        intake.commit_allowed.set()
+        first_order = make_order([])
+        with self.assertRaises(OrderIntakeTimeout):
+            intake.submit(first_order)
+        intake.timeout = None
+        second_order = {**first_order, 'address': 'Москва, Тверская 3'}
+        intake.submit(second_order)
+        self.assertEqual(intake.commits, [[second_order]])
+
+    def test_failed_notification_does_not_commit_orders_again(self):
+        self.notify_about_orders.side_effect = RuntimeError
+        intake = StubOrderIntake(batch_size=3, flush_interval=5, timeout=5)
+        intake.commit_allowed.set()
+        with self.assertLogs('foodcartapp.intake', 'ERROR'), ThreadPoolExecutor(max_workers=3) as executor:
+            orders = list(executor.map(intake.submit, [make_order([])] * 3))
+        self.assertEqual([order.id for order in orders], [1, 1, 1])
+        self.assertEqual(len(intake.commits), 1)
+
+
+class ProductListTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = ProductCategory.objects.create(name='Бургеры')
+        cls.products = [
+            Product.objects.create(name=f'Бургер №{number}', category=category, price=100 + number, image='burger.jpg')
+            for number in range(10)
+        ]
+
+    def add_restaurants(self, count):
+        for number in range(count):
+            restaurant = Restaurant.objects.create(name=f'Star Burger №{number}', address=f'Москва, Тверская {number}')
+            RestaurantMenuItem.objects.bulk_create([
+                RestaurantMenuItem(restaurant=restaurant, product=product) for product in self.products
+            ])
+
+    def get_products(self):
+        # catalog versions are bumped after commit, test transaction is not committed
+        cache.clear()
+        response = self.client.get('/api/products/')
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def test_queries_do_not_grow_with_restaurants(self):
+        self.add_restaurants(1)
+        with self.assertNumQueries(2):
+            products = self.get_products()
+        self.assertEqual(len(products), 10)
+        self.assertEqual(len(products[0]['restaurants']), 1)
+
+        self.add_restaurants(20)
+        with self.assertNumQueries(2):
+            products = self.get_products()
+        self.assertEqual(len(products[0]['restaurants']), 21)
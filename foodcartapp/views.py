@@ -1,18 +1,23 @@
-from django.db import transaction
+from urllib.parse import urlencode
+
+from django.conf import settings
 from django.http import JsonResponse
 from django.templatetags.static import static
 from rest_framework.decorators import api_view
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 
+from .idempotency import idempotent
+from .intake import OrderIntakeTimeout, get_order_intake, register_orders
 from .models import Product
-from .models import Order
-from .models import OrderProduct
-from .serializers import OrderSerializer
+from .payloads import get_catalog_payload, payload_response
+from .renderers import is_pretty_requested, iter_json_array
+from .serializers import OrderSerializer, PRODUCT_CATALOG_FIELDS, ProductCatalogParamsSerializer
 
 
-def banners_list_api(request):
+def serialize_banners():
     # FIXME move data to db?
-    return JsonResponse([
+    return [
         {
             'title': 'Burger',
             'src': static('burger.jpg'),
@@ -28,38 +33,97 @@ def banners_list_api(request):
             'src': static('tasty.jpg'),
             'text': 'Food is incomplete without a tasty dessert',
         }
-    ], safe=False, json_dumps_params={
-        'ensure_ascii': False,
-        'indent': 4,
-    })
+    ]
 
 
-def product_list_api(request):
-    products = Product.objects.select_related('category').available()
+def banners_list_api(request):
+    pretty = is_pretty_requested(request)
+    payload = get_catalog_payload(
+        f'banners:{pretty:d}',
+        lambda: (iter_json_array(serialize_banners(), pretty), {}),
+    )
+    return payload_response(request, payload)
 
-    dumped_products = []
-    for product in products:
-        dumped_product = {
-            'id': product.id,
-            'name': product.name,
-            'price': product.price,
-            'special_status': product.special_status,
-            'description': product.description,
-            'category': {
-                'id': product.category.id,
-                'name': product.category.name,
-            } if product.category else None,
-            'image': product.image.url,
-            'restaurant': {
-                'id': product.id,
-                'name': product.name,
+
+# columns needed by fields of product_list_api items and the way to get field value from product
+PRODUCT_FIELDS = {
+    'id': (['id'], lambda product: product.id),
+    'name': (['name'], lambda product: product.name),
+    'price': (['price'], lambda product: product.price),
+    'special_status': (['special_status'], lambda product: product.special_status),
+    'description': (['description'], lambda product: product.description),
+    'category': (
+        ['category__id', 'category__name'],
+        lambda product: {
+            'id': product.category.id,
+            'name': product.category.name,
+        } if product.category else None,
+    ),
+    'image': (['image'], lambda product: product.image.url),
+    # available_restaurants are attached to products by attach_available_restaurants
+    'restaurants': (
+        [],
+        lambda product: [
+            {
+                'id': restaurant_id,
+                'name': restaurant_name,
             }
-        }
-        dumped_products.append(dumped_product)
-    return JsonResponse(dumped_products, safe=False, json_dumps_params={
-        'ensure_ascii': False,
-        'indent': 4,
-    })
+            for restaurant_id, restaurant_name in product.available_restaurants
+        ],
+    ),
+}
+
+
+def serialize_product(product, fields=PRODUCT_CATALOG_FIELDS):
+    return {field: PRODUCT_FIELDS[field][1](product) for field in fields}
+
+
+def attach_available_restaurants(products, restaurants):
+    for product in products:
+        product.available_restaurants = restaurants.get(product.id, [])
+        yield product
+
+
+def build_catalog_page(path, params, pretty):
+    """Return chunks of catalog page and headers with link to the next page."""
+    fields = params.validated_data.get('fields', PRODUCT_CATALOG_FIELDS)
+    columns = [column for field in fields for column in PRODUCT_FIELDS[field][0]]
+    products = params.filter(Product.objects).only(*columns)
+    if 'category' in fields:
+        products = products.select_related('category')
+
+    limit = params.validated_data.get('limit')
+    headers = {}
+    if limit is None:
+        page = products.iterator()
+        page_products = products
+    else:
+        page = list(products[:limit + 1])
+        if len(page) > limit:
+            page = page[:limit]
+            next_page_params = params.get_query_params(cursor=page[-1].id)
+            if pretty:
+                next_page_params['pretty'] = 1
+            headers['Link'] = f'<{path}?{urlencode(next_page_params)}>; rel="next"'
+        page_products = Product.objects.filter(pk__in=[product.id for product in page])
+
+    if 'restaurants' in fields:
+        page = attach_available_restaurants(page, page_products.get_available_restaurants())
+    products = (serialize_product(product, fields) for product in page)
+    return iter_json_array(products, pretty), headers
+
+
+def product_list_api(request):
+    params = ProductCatalogParamsSerializer(data=request.GET)
+    if not params.is_valid():
+        return JsonResponse(params.errors, status=400, json_dumps_params={'ensure_ascii': False})
+
+    pretty = is_pretty_requested(request)
+    payload = get_catalog_payload(
+        f'products:{pretty:d}:{urlencode(params.get_query_params())}',
+        lambda: build_catalog_page(request.path, params, pretty),
+    )
+    return payload_response(request, payload)
 
 
 def check_required_field(data, field_name, field_class):
@@ -73,26 +137,50 @@ def check_required_field(data, field_name, field_class):
 
 
 @api_view(['POST'])
+@idempotent
 def register_order(request):
     serializer = OrderSerializer(data=request.data)
     serializer.is_valid(raise_exception=True)
 
-    with transaction.atomic():
-        order = Order.objects.create(
-            address=serializer.validated_data_source['address'],
-            first_name=serializer.validated_data_source['first_name'],
-            last_name=serializer.validated_data_source['last_name'],
-            contact_phone=serializer.validated_data_source['contact_phone'],
-        )
-
-        order_products = [
-            OrderProduct(
-                product=product['product'],
-                quantity=product['quantity'],
-                order=order,
-                price=product['product'].price
-            )
-            for product in serializer.validated_data_source['products']
-        ]
-        OrderProduct.objects.bulk_create(order_products)
+    if settings.ORDER_INTAKE_GROUP_COMMIT:
+        try:
+            get_order_intake().submit(serializer.validated_data_source)
+        except OrderIntakeTimeout:
+            # order is not created, so client may safely repeat the request
+            return Response({'detail': 'Сервер перегружен, повторите запрос позже.'}, status=503)
+    else:
+        register_orders([serializer.validated_data_source])
     return Response(serializer.data)
+
+
+@api_view(['POST'])
+@idempotent
+def register_orders_batch(request):
+    """
+    Register up to ORDER_BATCH_MAX_SIZE orders of partner at once.
+
+    Valid orders are created in one transaction, response has result for every order in the same order:
+    id and data of created order or validation errors.
+    """
+    orders_data = request.data.get('orders') if isinstance(request.data, dict) else None
+    if not isinstance(orders_data, list) or not orders_data:
+        raise ValidationError({'orders': ['Ожидался непустой список заказов.']})
+    if len(orders_data) > settings.ORDER_BATCH_MAX_SIZE:
+        raise ValidationError({'orders': [f'Не больше {settings.ORDER_BATCH_MAX_SIZE} заказов за раз.']})
+
+    context = OrderSerializer.get_products_context(orders_data)
+    serializers = [OrderSerializer(data=order_data, context=context) for order_data in orders_data]
+    valid_serializers = [serializer for serializer in serializers if serializer.is_valid()]
+
+    orders = []
+    if valid_serializers:
+        orders = register_orders([serializer.validated_data_source for serializer in valid_serializers])
+
+    created_orders = {serializer: order for serializer, order in zip(valid_serializers, orders)}
+    results = []
+    for serializer in serializers:
+        if serializer in created_orders:
+            results.append({'id': created_orders[serializer].id, 'order': serializer.data})
+        else:
+            results.append({'errors': serializer.errors})
+    return Response({'orders': results})
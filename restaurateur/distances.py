@@ -0,0 +1,33 @@
+import numpy as np
+
+# mean Earth radius of WGS-84 ellipsoid
+EARTH_RADIUS_KM = 6371.0088
+
+
+def to_coordinates_array(lat_lons):
+    """Convert sequence of (lat, lon) to array of shape (n, 2), unknown coordinates become NaN."""
+    return np.array(
+        [(np.nan, np.nan) if None in lat_lon else lat_lon for lat_lon in lat_lons],
+        dtype=float,
+    ).reshape(-1, 2)
+
+
+def distance_matrix(lat_lons_1, lat_lons_2):
+    """
+    Compute haversine distances in km between every point of :lat_lons_1: and every point of :lat_lons_2:.
+
+    Returns array of shape (len(lat_lons_1), len(lat_lons_2)), distance is NaN if any coordinate is unknown.
+
+    Earth is considered a sphere, so the result differs from geodesic distance of geopy by up to 0.5%.
+    At Moscow latitudes it is 0.35% at most: up to 35 m for 10 km and up to 150 m for 50 km.
+    """
+    points_1 = np.radians(to_coordinates_array(lat_lons_1))
+    points_2 = np.radians(to_coordinates_array(lat_lons_2))
+    lat_1, lon_1 = points_1[:, 0, np.newaxis], points_1[:, 1, np.newaxis]
+    lat_2, lon_2 = points_2[np.newaxis, :, 0], points_2[np.newaxis, :, 1]
+
+    haversine = (
+        np.sin((lat_2 - lat_1) / 2) ** 2
+        + np.cos(lat_1) * np.cos(lat_2) * np.sin((lon_2 - lon_1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(haversine, 0, 1)))
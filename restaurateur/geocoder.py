@@ -0,0 +1,171 @@
+import random
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.utils.module_loading import import_string
+from requests.adapters import HTTPAdapter
+
+
+# geocoder answers so to the addresses it can't find, other 4xx are problems of the key, quota or rate
+UNKNOWN_ADDRESS_STATUSES = {400, 404}
+TOO_MANY_REQUESTS = 429
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Geocoder is not requested because it failed too many times in a row."""
+
+
+class GeocoderResponseError(requests.exceptions.RequestException):
+    """Geocoder answered with JSON of unexpected shape."""
+
+
+class CircuitBreaker:
+    """
+    Stop requests to upstream after :failure_threshold: failures in a row.
+
+    After :reset_timeout: seconds one trial request is allowed, its success closes the circuit.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            # half-open: let one request through, others wait for the next timeout
+            self._opened_at = time.monotonic()
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+class YandexGeocoder:
+    """
+    Client of Yandex geocoder with pooled keep-alive connections.
+
+    Connection errors, timeouts and 5xx responses are retried with exponential backoff and jitter,
+    429 is retried after Retry-After seconds if they are not longer than :max_retry_after:.
+    Other 4xx responses raise HTTPError at once. All errors except unknown address open the circuit.
+    """
+    # https://dvmn.org/encyclopedia/api-docs/yandex-geocoder-api/
+    default_url = 'https://geocode-maps.yandex.ru/1.x'
+
+    def __init__(self, apikey, url=None, connect_timeout=1.0, read_timeout=3.0, retries=2, backoff=0.2,
+                 max_retry_after=10.0, pool_size=10, circuit_breaker=None):
+        self.apikey = apikey
+        self.url = url or self.default_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_retry_after = max_retry_after
+        self.circuit_breaker = circuit_breaker or CircuitBreaker(failure_threshold=5, reset_timeout=30)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def fetch_coordinates(self, address):
+        """Return (lon, lat) of the most relevant place or None if address is unknown."""
+        if not self.circuit_breaker.allow_request():
+            raise CircuitOpenError(f'geocoder {self.url} is unavailable')
+
+        try:
+            coordinates = self.parse_coordinates(self.request(address))
+        except requests.exceptions.RequestException as error:
+            if not is_client_error(error):
+                self.circuit_breaker.record_failure()
+            raise
+        self.circuit_breaker.record_success()
+        return coordinates
+
+    def parse_coordinates(self, response):
+        try:
+            found_places = response.json()['response']['GeoObjectCollection']['featureMember']
+            if not found_places:
+                return None
+
+            most_relevant = found_places[0]
+            lon, lat = most_relevant['GeoObject']['Point']['pos'].split(" ")
+        except (ValueError, KeyError, IndexError, TypeError, AttributeError) as error:
+            raise GeocoderResponseError(f'unexpected answer of geocoder: {error!r}', response=response) from error
+        return lon, lat
+
+    def request(self, address):
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.get(self.url, timeout=self.timeout, params={
+                    "geocode": address,
+                    "apikey": self.apikey,
+                    "format": "json",
+                })
+                response.raise_for_status()
+                return response
+            except requests.exceptions.RequestException as error:
+                delay = self.get_retry_delay(error, attempt)
+                if delay is None or attempt == self.retries:
+                    raise
+            time.sleep(delay)
+
+    def get_retry_delay(self, error, attempt):
+        """Seconds to wait before the next attempt, None if the request should not be retried."""
+        backoff_delay = self.backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+        if not isinstance(error, requests.exceptions.HTTPError) or error.response.status_code >= 500:
+            return backoff_delay
+        if error.response.status_code != TOO_MANY_REQUESTS:
+            return None
+        retry_after = error.response.headers.get('Retry-After', '')
+        if not retry_after.isdigit():
+            return backoff_delay
+        return int(retry_after) if int(retry_after) <= self.max_retry_after else None
+
+
+def is_client_error(error):
+    """Geocoder rejected the address itself, so the address is unknown and retry won't help."""
+    return (
+        isinstance(error, requests.exceptions.HTTPError)
+        and error.response is not None
+        and error.response.status_code in UNKNOWN_ADDRESS_STATUSES
+    )
+
+
+_geocoders = {}
+_geocoders_lock = threading.Lock()
+
+
+def get_geocoder(apikey):
+    """Return shared geocoder of class from GEOCODER_BACKEND setting, one for every apikey."""
+    with _geocoders_lock:
+        if apikey not in _geocoders:
+            geocoder_class = import_string(settings.GEOCODER_BACKEND)
+            _geocoders[apikey] = geocoder_class(
+                apikey,
+                url=settings.GEOCODER_URL,
+                connect_timeout=settings.GEOCODER_CONNECT_TIMEOUT,
+                read_timeout=settings.GEOCODER_READ_TIMEOUT,
+                retries=settings.GEOCODER_RETRIES,
+                pool_size=settings.GEOCODER_MAX_WORKERS,
+                circuit_breaker=CircuitBreaker(
+                    failure_threshold=settings.GEOCODER_CIRCUIT_FAILURES,
+                    reset_timeout=settings.GEOCODER_CIRCUIT_RESET_TIMEOUT,
+                ),
+            )
+        return _geocoders[apikey]
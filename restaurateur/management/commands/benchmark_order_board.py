@@ -0,0 +1,113 @@
+import random
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from addressesapp.models import Address
+from foodcartapp.models import Order, OrderProduct, Product, Restaurant, RestaurantMenuItem
+from restaurateur.projections import load_order_rows
+from restaurateur.views import get_order_items
+
+
+def create_fake_orders(orders_count):
+    """Create open orders with geocoded addresses, so the board doesn't request geocoder."""
+    Restaurant.objects.bulk_create(
+        Restaurant(name=f'Benchmark {number}', address=f'Benchmark restaurant {number}') for number in range(20)
+    )
+    Product.objects.bulk_create(
+        Product(name=f'Benchmark {number}', price=100 + number, image='benchmark.jpg') for number in range(30)
+    )
+    restaurants = list(Restaurant.objects.filter(name__startswith='Benchmark'))
+    products = list(Product.objects.filter(name__startswith='Benchmark'))
+    RestaurantMenuItem.objects.bulk_create(
+        RestaurantMenuItem(restaurant=restaurant, product=product, availability=random.random() > 0.2)
+        for restaurant in restaurants
+        for product in products
+    )
+
+    order_addresses = [f'Benchmark order {number}' for number in range(500)]
+    known_addresses = set(Address.objects.values_list('address', flat=True))
+    addresses = set(order_addresses) | set(Restaurant.objects.values_list('address', flat=True))
+    Address.objects.bulk_create(
+        Address(
+            address=address,
+            lat=55.55 + random.random() * 0.4,
+            lon=37.35 + random.random() * 0.5,
+            updated_at=timezone.now(),
+        )
+        for address in addresses - known_addresses
+    )
+
+    Order.objects.bulk_create(
+        Order(
+            address=random.choice(order_addresses),
+            first_name='Benchmark',
+            last_name='Benchmark',
+            contact_phone='+79000000000',
+            comment='Benchmark order',
+        )
+        for _ in range(orders_count)
+    )
+    order_ids = Order.objects.filter(first_name='Benchmark').values_list('id', flat=True)
+    OrderProduct.objects.bulk_create(
+        OrderProduct(order_id=order_id, product=product, quantity=1, price=product.price)
+        for order_id in order_ids
+        for product in random.sample(products, 3)
+    )
+
+
+def build_board_from_models(orders_count):
+    """Board built from model graph, as it was before projections."""
+    orders = list(
+        Order.objects
+        .select_related('responsible_restaurant')
+        .prefetch_related('products__product__menu_items__restaurant')
+        .for_board()[:orders_count]
+    )
+    return get_order_items(orders)
+
+
+def build_board_from_projections(orders_count):
+    return get_order_items(load_order_rows(Order.objects.for_board()[:orders_count]))
+
+
+def measure(function, *args):
+    started_at = time.perf_counter()
+    function(*args)
+    elapsed = time.perf_counter() - started_at
+
+    tracemalloc.start()
+    function(*args)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak_memory
+
+
+class Command(BaseCommand):
+    help = 'Compare time and peak memory of building the order board from models and from projections'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000],
+                            help='numbers of open orders')
+
+    def handle(self, *args, **options):
+        random.seed(0)
+        self.stdout.write(f'{"orders":>8} {"way":>12} {"time, s":>10} {"peak, MB":>10}')
+        for orders_count in options['sizes']:
+            # fake data is rolled back
+            with transaction.atomic():
+                create_fake_orders(orders_count)
+                # warm up caches of coordinates and restaurants
+                build_board_from_projections(10)
+                for way, build_board in [
+                    ('models', build_board_from_models),
+                    ('projections', build_board_from_projections),
+                ]:
+                    elapsed, peak_memory = measure(build_board, orders_count)
+                    self.stdout.write(
+                        f'{orders_count:>8} {way:>12} {elapsed:>10.2f} {peak_memory / 1024 / 1024:>10.1f}'
+                    )
+                transaction.set_rollback(True)
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from restaurateur.utils import get_coordinates_cache_stats, reset_coordinates_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Show hits and misses of the caches of address coordinates, counted by all processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='start counting again')
+
+    def handle(self, *args, **options):
+        stats = get_coordinates_cache_stats()
+        lookups = stats['lru_hit'] + stats['django_cache_hit'] + stats['db_hit'] + stats['miss']
+        for name, count in stats.items():
+            self.stdout.write(f'{name:>16} {count:>10}')
+        if lookups:
+            hits = lookups - stats['miss']
+            self.stdout.write(f'{"hit ratio":>16} {hits / lookups:>10.1%}')
+        if options['reset']:
+            reset_coordinates_cache_stats()
+            self.stdout.write('counters are reset')
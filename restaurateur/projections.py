@@ -0,0 +1,58 @@
+from foodcartapp.models import Order, Restaurant
+
+
+class OrderRow:
+    """Fields of order shown on the order board, loaded with `values_list` instead of model instance."""
+    __slots__ = (
+        'id',
+        'status',
+        'payment_type',
+        'total',
+        'first_name',
+        'last_name',
+        'contact_phone',
+        'address',
+        'comment',
+        'created_at',
+        'updated_at',
+        'responsible_restaurant_id',
+        'responsible_restaurant_name',
+    )
+    source_fields = __slots__[:-1] + ('responsible_restaurant__name',)
+
+    status_names = dict(Order.STATUS_CHOICES)
+    payment_type_names = dict(Order.PAYMENT_CHOICES)
+
+    def __init__(self, *values):
+        for field, value in zip(self.__slots__, values):
+            setattr(self, field, value)
+
+    @property
+    def client_name(self):
+        return f'{self.last_name} {self.first_name}'
+
+    def get_status_display(self):
+        return self.status_names.get(self.status, self.status)
+
+    def get_payment_type_display(self):
+        return self.payment_type_names.get(self.payment_type, self.payment_type)
+
+
+class RestaurantRow:
+    __slots__ = ('id', 'name', 'address')
+
+    def __init__(self, id, name, address):
+        self.id = id
+        self.name = name
+        self.address = address
+
+
+def load_order_rows(orders):
+    return [OrderRow(*values) for values in orders.values_list(*OrderRow.source_fields)]
+
+
+def load_restaurant_rows():
+    return {
+        restaurant_id: RestaurantRow(restaurant_id, name, address)
+        for restaurant_id, name, address in Restaurant.objects.values_list('id', 'name', 'address')
+    }
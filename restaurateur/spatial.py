@@ -0,0 +1,160 @@
+import math
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+from foodcartapp.cache_versions import RESTAURANTS, get_cache_version
+from foodcartapp.models import Restaurant
+from .distances import distance_matrix
+from .utils import fetch_many_coordinates_form_db_or_api
+
+KM_IN_LATITUDE_DEGREE = 111.2
+
+
+class RestaurantIndex:
+    """
+    Grid of restaurants by coordinates for lookup of the nearest ones.
+
+    Restaurants are put into square cells of :cell_size_km:, lookup checks rings of cells around the point
+    and stops as soon as farther cells can't contain closer restaurants.
+    """
+
+    def __init__(self, restaurants_coordinates, cell_size_km):
+        self.cell_size_km = cell_size_km
+        known_coordinates = {
+            restaurant_id: lat_lon
+            for restaurant_id, lat_lon in restaurants_coordinates.items()
+            if None not in lat_lon
+        }
+        self.unknown_restaurant_ids = [
+            restaurant_id for restaurant_id in restaurants_coordinates if restaurant_id not in known_coordinates
+        ]
+
+        reference_lat = sum(lat for lat, _ in known_coordinates.values()) / len(known_coordinates) \
+            if known_coordinates else 0
+        self.lat_step = cell_size_km / KM_IN_LATITUDE_DEGREE
+        self.lon_step = cell_size_km / (KM_IN_LATITUDE_DEGREE * max(math.cos(math.radians(reference_lat)), 0.01))
+
+        self.coordinates = known_coordinates
+        self.cells = defaultdict(list)
+        for restaurant_id, lat_lon in known_coordinates.items():
+            self.cells[self.get_cell(lat_lon)].append(restaurant_id)
+
+    def get_cell(self, lat_lon):
+        lat, lon = lat_lon
+        return math.floor(lat / self.lat_step), math.floor(lon / self.lon_step)
+
+    def iterate_ring(self, center, radius):
+        row, column = center
+        if radius == 0:
+            yield center
+            return
+        for offset in range(-radius, radius + 1):
+            yield row - radius, column + offset
+            yield row + radius, column + offset
+        for offset in range(-radius + 1, radius):
+            yield row + offset, column - radius
+            yield row + offset, column + radius
+
+    def nearest(self, lat_lon, k, radius_km, restaurant_ids=None):
+        """
+        Find up to :k: nearest restaurants not farther than :radius_km: from the point.
+
+        Only restaurants from :restaurant_ids: are considered, if it's given.
+        Returns list of (restaurant_id, distance in km) sorted by distance.
+        If the point or some restaurants have unknown coordinates, the list is filled up to :k: with them,
+        their distance is NaN.
+        """
+        def is_suitable(restaurant_id):
+            return restaurant_ids is None or restaurant_id in restaurant_ids
+
+        unknown_restaurants = [
+            (restaurant_id, math.nan) for restaurant_id in self.unknown_restaurant_ids if is_suitable(restaurant_id)
+        ]
+        if None in lat_lon:
+            known_restaurants = [
+                (restaurant_id, math.nan) for restaurant_id in self.coordinates if is_suitable(restaurant_id)
+            ]
+            return (known_restaurants + unknown_restaurants)[:k]
+
+        center = self.get_cell(lat_lon)
+        max_ring = max(
+            (max(abs(row - center[0]), abs(column - center[1])) for row, column in self.cells),
+            default=-1,
+        )
+        found = []
+        for ring in range(max_ring + 1):
+            # any point of the ring is at least that far from the point
+            ring_distance_km = (ring - 1) * self.cell_size_km
+            if ring_distance_km > radius_km:
+                break
+            if len(found) >= k and ring_distance_km > found[k - 1][1]:
+                break
+
+            ring_restaurant_ids = [
+                restaurant_id
+                for cell in self.iterate_ring(center, ring)
+                for restaurant_id in self.cells.get(cell, [])
+                if is_suitable(restaurant_id)
+            ]
+            if not ring_restaurant_ids:
+                continue
+            distances = distance_matrix(
+                [lat_lon],
+                [self.coordinates[restaurant_id] for restaurant_id in ring_restaurant_ids],
+            )[0]
+            found.extend(
+                (restaurant_id, float(distance))
+                for restaurant_id, distance in zip(ring_restaurant_ids, distances)
+                if distance <= radius_km
+            )
+            found.sort(key=lambda item: item[1])
+
+        return (found + unknown_restaurants)[:k]
+
+
+_restaurant_index = None
+_restaurant_index_version = None
+_restaurant_index_expires_at = None
+_restaurant_index_lock = threading.Lock()
+
+
+def get_restaurant_index(apikey):
+    """
+    Return index of all restaurants, it's rebuilt when restaurants are changed.
+
+    Index with not geocoded restaurants is kept only for RESTAURANT_INDEX_UNKNOWN_TTL seconds,
+    so they get into index soon after they are geocoded, and restaurant without address doesn't make
+    every page load rebuild the index.
+    """
+    global _restaurant_index, _restaurant_index_version, _restaurant_index_expires_at
+
+    version = get_cache_version(RESTAURANTS)
+    with _restaurant_index_lock:
+        if (
+            _restaurant_index is not None
+            and _restaurant_index_version == version
+            and (_restaurant_index_expires_at is None or time.monotonic() < _restaurant_index_expires_at)
+        ):
+            return _restaurant_index
+
+    restaurant_addresses = dict(Restaurant.objects.values_list('id', 'address'))
+    coordinates = fetch_many_coordinates_form_db_or_api(
+        apikey,
+        set(restaurant_addresses.values()),
+        settings.GEOCODER_TIMEOUT,
+        settings.GEOCODER_MAX_WORKERS,
+    )
+    restaurant_index = RestaurantIndex(
+        {restaurant_id: coordinates[address] for restaurant_id, address in restaurant_addresses.items()},
+        settings.RESTAURANT_INDEX_CELL_KM,
+    )
+
+    with _restaurant_index_lock:
+        _restaurant_index, _restaurant_index_version = restaurant_index, version
+        _restaurant_index_expires_at = None
+        if restaurant_index.unknown_restaurant_ids:
+            _restaurant_index_expires_at = time.monotonic() + settings.RESTAURANT_INDEX_UNKNOWN_TTL
+    return restaurant_index
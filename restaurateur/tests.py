@@ -1,3 +1,275 @@
-from django.test import TestCase
+import json
+import math
+import random
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import timedelta
+from unittest import skipIf
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+import requests
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from addressesapp.models import Address
+from foodcartapp.models import Order
+
+from .distances import distance_matrix
+from .geocoder import CircuitBreaker, CircuitOpenError, GeocoderResponseError, YandexGeocoder, is_client_error
+from .spatial import RestaurantIndex
+from .utils import encode_changes_cursor
+
+try:
+    from geopy import distance as geopy_distance
+except ImportError:
+    geopy_distance = None
+
+
+class DistanceMatrixTest(SimpleTestCase):
+    def test_shape(self):
+        distances = distance_matrix([(55.75, 37.62), (55.7, 37.5)], [(55.8, 37.6), (55.6, 37.7), (55.9, 37.4)])
+        self.assertEqual(distances.shape, (2, 3))
+
+    def test_same_point(self):
+        self.assertEqual(distance_matrix([(55.75, 37.62)], [(55.75, 37.62)])[0][0], 0)
+
+    def test_unknown_coordinates_give_nan(self):
+        distances = distance_matrix([(None, None), (55.75, 37.62)], [(55.8, 37.6), (None, None)])
+        self.assertTrue(math.isnan(distances[0][0]))
+        self.assertTrue(math.isnan(distances[0][1]))
+        self.assertTrue(math.isnan(distances[1][1]))
+        self.assertFalse(math.isnan(distances[1][0]))
+
+    @skipIf(geopy_distance is None, 'geopy is installed with requirements-dev.txt')
+    def test_accuracy_against_geopy_in_moscow(self):
+        random_generator = random.Random(0)
+        points = [
+            (random_generator.uniform(55.4, 56.1), random_generator.uniform(37.0, 38.2))
+            for _ in range(200)
+        ]
+        points_1, points_2 = points[:100], points[100:]
+        distances = distance_matrix(points_1, points_2)
+
+        max_error = 0
+        for row, point_1 in enumerate(points_1):
+            for column, point_2 in enumerate(points_2):
+                geodesic_distance = geopy_distance.distance(point_1, point_2).km
+                max_error = max(max_error, abs(distances[row][column] - geodesic_distance) / geodesic_distance)
+        self.assertLessEqual(max_error, 0.0035)
+
+
+class GeocoderStubHandler(BaseHTTPRequestHandler):
+    """
+    Answers like Yandex geocoder depending on the address.
+
+    `found`, `unknown`, `bad json` and statuses as addresses: `503`, `403`, `400`.
+    `429 then found` and `503 then found` fail on the first request only.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        address = parse_qs(urlparse(self.path).query)['geocode'][0]
+        self.server.requests[address] += 1
+        answer, _, then = address.partition(' then ')
+        if then and self.server.requests[address] > 1:
+            answer = then
+        if answer.isdigit():
+            self.send_response(int(answer))
+            if answer == '429':
+                self.send_header('Retry-After', '0')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        members = [{'GeoObject': {'Point': {'pos': '37.6 55.7'}}}] if answer == 'found' else []
+        body = b'{"response": {}}' if answer == 'bad json' else json.dumps(
+            {'response': {'GeoObjectCollection': {'featureMember': members}}}
+        ).encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class YandexGeocoderTest(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), GeocoderStubHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.requests = Counter()
+        self.geocoder = YandexGeocoder(
+            'secret-key',
+            url=f'http://127.0.0.1:{self.server.server_port}/',
+            retries=2,
+            backoff=0,
+            circuit_breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60),
+        )
+
+    def test_coordinates(self):
+        self.assertEqual(self.geocoder.fetch_coordinates('found'), ('37.6', '55.7'))
+        self.assertIsNone(self.geocoder.fetch_coordinates('unknown'))
+
+    def test_server_errors_are_retried(self):
+        self.assertEqual(self.geocoder.fetch_coordinates('503 then found'), ('37.6', '55.7'))
+        self.assertEqual(self.server.requests['503 then found'], 2)
+
+    def test_rate_limit_is_retried_after_retry_after(self):
+        self.assertEqual(self.geocoder.fetch_coordinates('429 then found'), ('37.6', '55.7'))
+        self.assertEqual(self.server.requests['429 then found'], 2)
+
+    def test_unknown_address_statuses_are_not_retried(self):
+        with self.assertRaises(requests.exceptions.HTTPError) as context:
+            self.geocoder.fetch_coordinates('400')
+        self.assertTrue(is_client_error(context.exception))
+        self.assertEqual(self.server.requests['400'], 1)
+
+    def test_forbidden_is_not_unknown_address(self):
+        with self.assertRaises(requests.exceptions.HTTPError) as context:
+            self.geocoder.fetch_coordinates('403')
+        self.assertFalse(is_client_error(context.exception))
+        self.assertEqual(self.server.requests['403'], 1)
+
+    def test_bad_json(self):
+        with self.assertRaises(GeocoderResponseError):
+            self.geocoder.fetch_coordinates('bad json')
+
+    def test_circuit_opens_after_failures(self):
+        for address in ['503', '403']:
+            with self.assertRaises(requests.exceptions.HTTPError):
+                self.geocoder.fetch_coordinates(address)
+        with self.assertRaises(CircuitOpenError):
+            self.geocoder.fetch_coordinates('found')
+        self.assertEqual(self.server.requests['503'], 3)
+        self.assertEqual(self.server.requests['found'], 0)
+
+    def test_unknown_addresses_do_not_open_circuit(self):
+        for _ in range(3):
+            with self.assertRaises(requests.exceptions.HTTPError):
+                self.geocoder.fetch_coordinates('404')
+        self.assertEqual(self.geocoder.fetch_coordinates('found'), ('37.6', '55.7'))
+
+
+class RestaurantIndexTest(SimpleTestCase):
+    def setUp(self):
+        random_generator = random.Random(0)
+        self.restaurants_coordinates = {
+            restaurant_id: (random_generator.uniform(55.4, 56.1), random_generator.uniform(37.0, 38.2))
+            for restaurant_id in range(300)
+        }
+        self.points = [
+            (random_generator.uniform(55.3, 56.2), random_generator.uniform(36.9, 38.3))
+            for _ in range(50)
+        ]
+        self.index = RestaurantIndex(self.restaurants_coordinates, cell_size_km=2)
+
+    def find_by_brute_force(self, lat_lon, k, radius_km, restaurant_ids=None):
+        restaurant_ids = sorted(restaurant_ids if restaurant_ids is not None else self.restaurants_coordinates)
+        distances = distance_matrix([lat_lon], [self.restaurants_coordinates[pk] for pk in restaurant_ids])[0]
+        found = sorted(
+            (distance, restaurant_id)
+            for restaurant_id, distance in zip(restaurant_ids, distances)
+            if distance <= radius_km
+        )
+        return [restaurant_id for _, restaurant_id in found[:k]]
+
+    def test_nearest_is_the_same_as_brute_force(self):
+        for lat_lon in self.points:
+            for k, radius_km in [(1, 50), (5, 50), (5, 3), (20, 10)]:
+                with self.subTest(lat_lon=lat_lon, k=k, radius_km=radius_km):
+                    nearest = self.index.nearest(lat_lon, k, radius_km)
+                    self.assertEqual(
+                        [restaurant_id for restaurant_id, _ in nearest],
+                        self.find_by_brute_force(lat_lon, k, radius_km),
+                    )
+
+    def test_only_given_restaurants(self):
+        restaurant_ids = set(range(0, 300, 7))
+        for lat_lon in self.points:
+            nearest = self.index.nearest(lat_lon, 5, 50, restaurant_ids)
+            self.assertEqual(
+                [restaurant_id for restaurant_id, _ in nearest],
+                self.find_by_brute_force(lat_lon, 5, 50, restaurant_ids),
+            )
+
+    def test_unknown_coordinates_come_last(self):
+        index = RestaurantIndex({1: (55.75, 37.62), 2: (None, None)}, cell_size_km=2)
+        nearest = index.nearest((55.75, 37.62), 5, 50)
+        self.assertEqual([restaurant_id for restaurant_id, _ in nearest], [1, 2])
+        self.assertTrue(math.isnan(nearest[1][1]))
+        self.assertEqual(len(index.nearest((None, None), 5, 50)), 2)
+
+
+@override_settings(ORDER_BOARD_CHANGES_OVERLAP=5)
+class OrderChangesTest(TestCase):
+    address = 'Москва, Тверская 1'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = get_user_model().objects.create_user('manager', password='manager', is_staff=True)
+        # known coordinates, so the geocoder is not requested
+        Address.objects.create(address=cls.address, lat=55.76, lon=37.61, updated_at=timezone.now())
+        cls.orders = [
+            Order.objects.create(address=cls.address, first_name='Иван', last_name='Петров', contact_phone='+79001234567')
+            for _ in range(3)
+        ]
+        long_ago = timezone.now() - timedelta(hours=1)
+        for number, order in enumerate(cls.orders):
+            Order.objects.filter(pk=order.pk).update(updated_at=long_ago + timedelta(seconds=number))
+            order.refresh_from_db()
+
+    def setUp(self):
+        self.client.force_login(self.manager)
+
+    def get_changes(self, cursor):
+        response = self.client.get('/manager/orders/changes/', {'since': cursor})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def stamp(self, order, seconds_ago):
+        Order.objects.filter(pk=order.pk).update(updated_at=timezone.now() - timedelta(seconds=seconds_ago))
+
+    def test_changes_after_cursor(self):
+        changes = self.get_changes(encode_changes_cursor(self.orders[0]))
+        self.assertEqual([order['id'] for order in changes['orders']], [self.orders[1].id, self.orders[2].id])
+        self.assertEqual(changes['cursor'], encode_changes_cursor(self.orders[2]))
+        self.assertFalse(changes['has_more'])
+
+        self.assertEqual(self.get_changes(changes['cursor'])['orders'], [])
+
+    def test_recent_changes_come_again(self):
+        cursor = encode_changes_cursor(self.orders[2])
+        # the order stamped earlier commits later, cursor must not pass it
+        self.stamp(self.orders[1], seconds_ago=1)
+        changes = self.get_changes(cursor)
+        self.assertEqual([order['id'] for order in changes['orders']], [self.orders[1].id])
+        self.assertEqual(changes['cursor'], cursor)
+
+        self.stamp(self.orders[0], seconds_ago=2)
+        changes = self.get_changes(changes['cursor'])
+        self.assertEqual([order['id'] for order in changes['orders']], [self.orders[0].id, self.orders[1].id])
+        self.assertEqual(changes['cursor'], cursor)
+
+    def test_settled_changes_move_cursor(self):
+        self.stamp(self.orders[0], seconds_ago=30)
+        changes = self.get_changes(encode_changes_cursor(self.orders[2]))
+        self.assertEqual([order['id'] for order in changes['orders']], [self.orders[0].id])
+        self.orders[0].refresh_from_db()
+        self.assertEqual(changes['cursor'], encode_changes_cursor(self.orders[0]))
+
+    def test_broken_cursor(self):
+        response = self.client.get('/manager/orders/changes/', {'since': 'broken'})
+        self.assertEqual(response.status_code, 400)
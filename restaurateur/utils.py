@@ -1,61 +1,236 @@
+import hashlib
+import math
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
-from geopy import distance
 import requests
 
-from addressesapp.models import Address
+from addressesapp.models import Address, GeocodingJob
+from foodcartapp.cursors import decode_cursor, encode_cursor
+from .geocoder import get_geocoder, is_client_error
 
 
 def fetch_coordinates(apikey, address):
-    # https://dvmn.org/encyclopedia/api-docs/yandex-geocoder-api/
-    base_url = "https://geocode-maps.yandex.ru/1.x"
-    response = requests.get(base_url, params={
-        "geocode": address,
-        "apikey": apikey,
-        "format": "json",
-    })
-    response.raise_for_status()
-    found_places = response.json()['response']['GeoObjectCollection']['featureMember']
+    return get_geocoder(apikey).fetch_coordinates(address)
 
-    if not found_places:
-        return None
 
-    most_relevant = found_places[0]
-    lon, lat = most_relevant['GeoObject']['Point']['pos'].split(" ")
-    return lon, lat
+def fetch_coordinates_concurrently(apikey, addresses, timeout, max_workers):
+    """
+    Geocode addresses in parallel threads.
 
+    Only addresses resolved before :timeout: seconds are returned, the others are left to the next call.
+    Address maps to None if geocoder doesn't know it or rejected the address with 400 or 404.
+    """
+    if not addresses:
+        return {}
 
-def fetch_coordinates_form_db_or_api(apikey, address):
-    try:
-        address_obj = Address.objects.get(address=address)
-        lat, lon = address_obj.lat, address_obj.lon
-        return lat, lon
-    except Address.DoesNotExist:
-        pass
-    try:
-        coordinates = fetch_coordinates(apikey, address)
-    except requests.exceptions.HTTPError:
-        coordinates = None
-
-    # coordinates is None and both cases: unknown address and HTTPError
-    address_obj = Address(address=address, updated_at=timezone.now())
-    if coordinates is None:
-        lon, lat = None, None
-    else:
-        lon, lat = coordinates
-        address_obj.lon = lon
-        address_obj.lat = lat
-    # write even bad coordinates
-    address_obj.save()
-    return lat, lon
-
-
-def get_distance(lat_lon_1, lat_lon_2):
-    lat1, lon1 = lat_lon_1
-    lat2, lon2 = lat_lon_2
-    for coordinate in [lat1, lon1, lat2, lon2]:
-        if coordinate is None:
-            return 'неизвестно'
-    return round(distance.distance(lat_lon_1, lat_lon_2).km, 1)
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(addresses)))
+    futures = {executor.submit(fetch_coordinates, apikey, address): address for address in addresses}
+    done, _ = wait(futures, timeout=timeout)
+    # don't wait for late answers, they will be requested again on the next page load
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    fetched_coordinates = {}
+    for future in done:
+        address = futures[future]
+        try:
+            fetched_coordinates[address] = future.result()
+        except requests.exceptions.RequestException as error:
+            if is_client_error(error):
+                fetched_coordinates[address] = None
+            # else network problems or geocoder is down, try again next time
+    return fetched_coordinates
+
+
+class LRUCache:
+    """Thread-safe in-process cache with limited size and time to live of entries."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                return default
+            value, expires_at = self._entries[key]
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            self._entries[key] = value, time.monotonic() + ttl
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+coordinates_lru_cache = LRUCache(settings.GEOCODER_CACHE_SIZE, settings.GEOCODER_CACHE_TTL)
+
+# hits and misses of every cache level, they are counted in django cache, so all processes share them
+COORDINATES_CACHE_STATS = ['lru_hit', 'django_cache_hit', 'db_hit', 'db_stale', 'miss']
+
+
+def get_coordinates_cache_stats_key(name):
+    return f'coordinates_cache_stats:{name}'
+
+
+def count_coordinates_cache_stats(stats):
+    """Add counts of :stats: to shared counters, concurrent updates may be lost on caches without atomic incr."""
+    for name, count in stats.items():
+        if not count:
+            continue
+        key = get_coordinates_cache_stats_key(name)
+        cache.add(key, 0, timeout=None)
+        try:
+            cache.incr(key, count)
+        except ValueError:
+            # evicted between add and incr
+            cache.set(key, count, timeout=None)
+
+
+def get_coordinates_cache_stats():
+    keys = {get_coordinates_cache_stats_key(name): name for name in COORDINATES_CACHE_STATS}
+    counts = cache.get_many(keys)
+    return {name: counts.get(key, 0) for key, name in keys.items()}
+
+
+def reset_coordinates_cache_stats():
+    cache.delete_many([get_coordinates_cache_stats_key(name) for name in COORDINATES_CACHE_STATS])
+
+
+def get_coordinates_cache_key(address):
+    return 'coordinates:' + hashlib.md5(address.encode()).hexdigest()
+
+
+def get_coordinates_cache_ttl(lat_lon):
+    """Unknown coordinates live shorter, so the address is geocoded again sooner."""
+    return settings.GEOCODER_CACHE_TTL if None not in lat_lon else settings.GEOCODER_NEGATIVE_CACHE_TTL
+
+
+def cache_coordinates(coordinates):
+    """Save coordinates to both cache levels."""
+    django_cache_entries = {}
+    for address, lat_lon in coordinates.items():
+        ttl = get_coordinates_cache_ttl(lat_lon)
+        coordinates_lru_cache.set(address, lat_lon, ttl)
+        django_cache_entries.setdefault(ttl, {})[get_coordinates_cache_key(address)] = lat_lon
+    for ttl, entries in django_cache_entries.items():
+        cache.set_many(entries, ttl)
+
+
+def get_coordinates_from_cache(addresses, stats):
+    """Find coordinates in the in-process cache, then in the django cache."""
+    coordinates = {}
+    for address in addresses:
+        lat_lon = coordinates_lru_cache.get(address)
+        if lat_lon is not None:
+            coordinates[address] = lat_lon
+    stats['lru_hit'] += len(coordinates)
+
+    cache_keys = {get_coordinates_cache_key(address): address for address in addresses if address not in coordinates}
+    if not cache_keys:
+        return coordinates
+    cached_coordinates = {cache_keys[key]: tuple(lat_lon) for key, lat_lon in cache.get_many(cache_keys).items()}
+    stats['django_cache_hit'] += len(cached_coordinates)
+    for address, lat_lon in cached_coordinates.items():
+        coordinates_lru_cache.set(address, lat_lon, get_coordinates_cache_ttl(lat_lon))
+    coordinates.update(cached_coordinates)
+    return coordinates
+
+
+def get_coordinates_from_db(addresses, stats):
+    """
+    Find coordinates in db.
+
+    Outdated addresses are returned as is and queued to be geocoded again,
+    unknown for geocoder addresses become outdated faster.
+    """
+    now = timezone.now()
+    coordinates = {}
+    stale_addresses = []
+    for address, lat, lon, updated_at in (
+        Address.objects
+        .filter(address__in=addresses)
+        .values_list('address', 'lat', 'lon', 'updated_at')
+    ):
+        coordinates[address] = lat, lon
+        ttl = settings.ADDRESS_COORDINATES_TTL if None not in (lat, lon) else settings.GEOCODER_NEGATIVE_CACHE_TTL
+        if updated_at + timedelta(seconds=ttl) < now:
+            stale_addresses.append(address)
+
+    stats['db_hit'] += len(coordinates)
+    stats['db_stale'] += len(stale_addresses)
+    if stale_addresses:
+        GeocodingJob.objects.enqueue(stale_addresses, refresh=True)
+    return coordinates
+
+
+def fetch_many_coordinates_form_db_or_api(apikey, addresses, timeout, max_workers):
+    """
+    Find (lat, lon) for every address: in the in-process cache, django cache, db and then in geocoder API.
+
+    Known addresses are loaded with one query, new ones are saved with one query.
+    Addresses which geocoder didn't resolve in time get (None, None) and are queued for the geocode worker.
+    """
+    stats = Counter()
+    coordinates = get_coordinates_from_cache(addresses, stats)
+
+    db_coordinates = get_coordinates_from_db([address for address in addresses if address not in coordinates], stats)
+    cache_coordinates(db_coordinates)
+    coordinates.update(db_coordinates)
+
+    not_found_addresses = [address for address in addresses if address not in coordinates]
+    stats['miss'] += len(not_found_addresses)
+    fetched_coordinates = fetch_coordinates_concurrently(apikey, not_found_addresses, timeout, max_workers)
+    new_address_objs = []
+    late_addresses = []
+    for address in not_found_addresses:
+        if address not in fetched_coordinates:
+            coordinates[address] = None, None
+            late_addresses.append(address)
+            continue
+
+        # coordinates is None and both cases: unknown address and HTTPError
+        address_obj = Address(address=address, updated_at=timezone.now())
+        if fetched_coordinates[address] is not None:
+            lon, lat = fetched_coordinates[address]
+            address_obj.lon = float(lon)
+            address_obj.lat = float(lat)
+        # write even bad coordinates
+        new_address_objs.append(address_obj)
+        coordinates[address] = address_obj.lat, address_obj.lon
+
+    # address can be saved by parallel request
+    Address.objects.bulk_create(new_address_objs, ignore_conflicts=True)
+    cache_coordinates({address_obj.address: (address_obj.lat, address_obj.lon) for address_obj in new_address_objs})
+    if late_addresses:
+        GeocodingJob.objects.enqueue(late_addresses)
+
+    count_coordinates_cache_stats(stats)
+    return coordinates
+
+
+def format_distance(distance):
+    if math.isnan(distance):
+        return 'неизвестно'
+    return round(float(distance), 1)
 
 
 def sort_restaurants(restaurant_items):
@@ -72,3 +247,31 @@ def sort_restaurants(restaurant_items):
         if isinstance(restaurant_item['distance'], float):
             restaurant_items[i]['distance'] = f'{restaurant_item["distance"]} км'
     return restaurant_items
+
+
+def encode_order_cursor(order):
+    """Encode position of order on manager board to url-safe string."""
+    return encode_cursor([order.status, order.created_at.isoformat(), order.id])
+
+
+def decode_order_cursor(cursor):
+    """Decode (status, created_at, id) from cursor, raise ValueError if cursor is broken."""
+    try:
+        status, created_at, order_id = decode_cursor(cursor)
+        return str(status), datetime.fromisoformat(created_at), int(order_id)
+    except (TypeError, ValueError) as error:
+        raise ValueError(f'Broken cursor: {cursor}') from error
+
+
+def encode_changes_cursor(order):
+    """Encode time of the order change to url-safe string."""
+    return encode_cursor([order.updated_at.isoformat(), order.id])
+
+
+def decode_changes_cursor(cursor):
+    """Decode (updated_at, id) from cursor, raise ValueError if cursor is broken."""
+    try:
+        updated_at, order_id = decode_cursor(cursor)
+        return datetime.fromisoformat(updated_at), int(order_id)
+    except (TypeError, ValueError) as error:
+        raise ValueError(f'Broken cursor: {cursor}') from error
@@ -1,6 +1,16 @@
+import json
+import math
+import time
+from datetime import timedelta
+
 from django import forms
 from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import redirect, render
+from django.template.loader import render_to_string
+from django.utils import timezone
 from django.views import View
 from django.urls import reverse_lazy
 from django.contrib.auth.decorators import user_passes_test
@@ -8,7 +18,12 @@ from django.contrib.auth.decorators import user_passes_test
 from django.contrib.auth import authenticate, login
 from django.contrib.auth import views as auth_views
 
-from .utils import get_distance, fetch_coordinates_form_db_or_api, sort_restaurants
+from .projections import load_order_rows, load_restaurant_rows
+from .spatial import get_restaurant_index
+from .utils import decode_changes_cursor, decode_order_cursor, encode_changes_cursor, encode_order_cursor
+from .utils import fetch_many_coordinates_form_db_or_api, format_distance, sort_restaurants
+from foodcartapp.cache_versions import MENU, RESTAURANTS, get_cache_version
+from foodcartapp.events import order_events
 from foodcartapp.models import Product, Restaurant, Order
 
 
@@ -29,6 +44,51 @@ class Login(forms.Form):
     )
 
 
+class OrderFilter(forms.Form):
+    status = forms.ChoiceField(
+        label='Статус', required=False,
+        choices=[('', 'Все')] + [choice for choice in Order.STATUS_CHOICES if choice[0] != Order.COMPLETED],
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    restaurant = forms.ModelChoiceField(
+        label='Ресторан', required=False,
+        queryset=Restaurant.objects.order_by('name'),
+        empty_label='Все',
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    created_from = forms.DateTimeField(
+        label='Создан с', required=False,
+        widget=forms.DateTimeInput(attrs={'class': 'form-control', 'type': 'datetime-local'})
+    )
+    created_to = forms.DateTimeField(
+        label='Создан по', required=False,
+        widget=forms.DateTimeInput(attrs={'class': 'form-control', 'type': 'datetime-local'})
+    )
+    cursor = forms.CharField(required=False, widget=forms.HiddenInput)
+
+    def clean_cursor(self):
+        cursor = self.cleaned_data['cursor']
+        if not cursor:
+            return None
+        try:
+            return decode_order_cursor(cursor)
+        except ValueError:
+            raise forms.ValidationError('Неверная ссылка на страницу')
+
+    def filter(self, orders):
+        if self.cleaned_data['status']:
+            orders = orders.filter(status=self.cleaned_data['status'])
+        if self.cleaned_data['restaurant']:
+            orders = orders.filter(responsible_restaurant=self.cleaned_data['restaurant'])
+        if self.cleaned_data['created_from']:
+            orders = orders.filter(created_at__gte=self.cleaned_data['created_from'])
+        if self.cleaned_data['created_to']:
+            orders = orders.filter(created_at__lte=self.cleaned_data['created_to'])
+        if self.cleaned_data['cursor']:
+            orders = orders.after(*self.cleaned_data['cursor'])
+        return orders
+
+
 class LoginView(View):
     def get(self, request, *args, **kwargs):
         form = Login()
@@ -91,46 +151,252 @@ def view_restaurants(request):
     })
 
 
-@user_passes_test(is_manager, login_url='restaurateur:login')
-def view_orders(request):
+def get_order_items(orders):
+    """
+    Find nearest restaurants able to cook every order.
+
+    Restaurants are not searched for completed orders and orders which already have responsible restaurant.
+    """
+    if not orders:
+        return []
     yandex_geo_apikey = settings.YANDEX_GEO_APIKEY
 
-    orders = Order.objects.prefetch_related('products__product__menu_items__restaurant'). \
-        with_price().exclude(status=Order.COMPLETED).order_by('status', '-created_at')
+    candidate_restaurant_ids = Order.objects.filter(
+        pk__in=[
+            order.id for order in orders
+            if not order.responsible_restaurant_id and order.status != Order.COMPLETED
+        ]
+    ).get_candidate_restaurant_ids()
+    all_restaurants = load_restaurant_rows()
 
-    # cache of addresses inside view to avoid make many queries for same restaurant
-    view_address_cache = {}
+    orders_with_restaurants = []
+    for order in orders:
+        restaurants = [
+            all_restaurants[restaurant_id]
+            for restaurant_id in candidate_restaurant_ids.get(order.id, [])
+        ]
+        orders_with_restaurants.append((order, restaurants))
+
+    # geocode all addresses at once, slow addresses will have unknown distance
+    coordinates = fetch_many_coordinates_form_db_or_api(
+        yandex_geo_apikey,
+        {order.address for order in orders},
+        settings.GEOCODER_TIMEOUT,
+        settings.GEOCODER_MAX_WORKERS,
+    )
+    restaurant_index = get_restaurant_index(yandex_geo_apikey)
 
     order_items = []
-    for order in orders:
-        # find lat, lon of address in order
-        if order.address not in view_address_cache:
-            coordinates = fetch_coordinates_form_db_or_api(yandex_geo_apikey, order.address)
-            view_address_cache[order.address] = coordinates
-
-        restaurants = []
-        if not order.responsible_restaurant:
-            # no need to calcalute distances if has responsible restaurant
-            restaurants = order.get_available_restaurants()
-
-        # find lat, lon for every available restaurant of order
-        for i, restaurant in enumerate(restaurants):
-            if restaurant.address not in view_address_cache:
-                coordinates = fetch_coordinates_form_db_or_api(yandex_geo_apikey, restaurant.address)
-                view_address_cache[restaurant.address] = coordinates
-
-            restaurants[i] = {
-                'restaurant': restaurant,
-                'distance': get_distance(view_address_cache[order.address], view_address_cache[restaurant.address])
+    for order, restaurants in orders_with_restaurants:
+        restaurants_by_id = {restaurant.id: restaurant for restaurant in restaurants}
+        nearest_restaurants = []
+        if restaurants:
+            nearest_restaurants = restaurant_index.nearest(
+                coordinates[order.address],
+                k=settings.ORDER_RESTAURANTS_LIMIT,
+                radius_km=settings.ORDER_RESTAURANTS_RADIUS_KM,
+                restaurant_ids=restaurants_by_id.keys(),
+            )
+        restaurant_items = sort_restaurants([
+            {
+                'restaurant': restaurants_by_id[restaurant_id],
+                'distance': format_distance(distance)
             }
-
-        restaurant_items = sort_restaurants(restaurants)
+            for restaurant_id, distance in nearest_restaurants
+        ])
 
         order_items.append(
             {
                 'order': order,
-                'restaurants': restaurant_items
+                'restaurants': restaurant_items,
+                'has_available_restaurants': bool(restaurants),
+                'has_unknown_distances': any(math.isnan(distance) for _, distance in nearest_restaurants),
             }
         )
+    return order_items
+
+
+def get_rendered_orders(orders):
+    """
+    Render rows of order board and lists of restaurants for orders.
+
+    Results are cached by order version, so geocoding and restaurants search are skipped for not changed orders.
+    Rows with unknown distances are not cached, they are rendered again when addresses are geocoded.
+    """
+    version = ':'.join([
+        get_cache_version(MENU),
+        get_cache_version(RESTAURANTS),
+        str(settings.ORDER_RESTAURANTS_LIMIT),
+        str(settings.ORDER_RESTAURANTS_RADIUS_KM),
+    ])
+    cache_keys = {
+        order.id: f'order_row:{order.id}:{order.updated_at.timestamp()}:{version}'
+        for order in orders
+    }
+    rendered_orders = cache.get_many(cache_keys.values())
+
+    not_cached_orders = [order for order in orders if cache_keys[order.id] not in rendered_orders]
+    new_rendered_orders = {}
+    for item in get_order_items(not_cached_orders):
+        cache_key = cache_keys[item['order'].id]
+        rendered_orders[cache_key] = {
+            'row': render_to_string('order_row.html', context={
+                'item': item,
+                'restaurants_radius_km': settings.ORDER_RESTAURANTS_RADIUS_KM,
+            }),
+            'restaurants': [
+                {
+                    'id': restaurant_item['restaurant'].id,
+                    'name': restaurant_item['restaurant'].name,
+                    'distance': restaurant_item['distance'],
+                }
+                for restaurant_item in item['restaurants']
+            ],
+        }
+        if not item['has_unknown_distances']:
+            new_rendered_orders[cache_key] = rendered_orders[cache_key]
+    cache.set_many(new_rendered_orders, settings.ORDER_ROW_CACHE_TTL)
+
+    return [rendered_orders[cache_keys[order.id]] for order in orders]
 
-    return render(request, template_name='order_items.html', context={'order_items': order_items})
+
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def view_orders(request):
+    order_filter = OrderFilter(request.GET)
+    orders = Order.objects.for_board()
+    if order_filter.is_valid():
+        orders = order_filter.filter(orders)
+
+    # taken before orders, so changes made during rendering will be sent to the page later
+    last_changed_order = Order.objects.filter(
+        updated_at__lte=get_changes_settled_at(),
+    ).order_by('updated_at', 'id').last()
+    changes_cursor = encode_changes_cursor(last_changed_order) if last_changed_order else ''
+
+    # one extra order to know if there is the next page
+    orders = load_order_rows(orders[:settings.ORDER_BOARD_PAGE_SIZE + 1])
+    first_page_url = None
+    if request.GET.get('cursor'):
+        first_page_params = request.GET.copy()
+        del first_page_params['cursor']
+        first_page_url = f'?{first_page_params.urlencode()}'
+    next_page_url = None
+    if len(orders) > settings.ORDER_BOARD_PAGE_SIZE:
+        orders = orders[:settings.ORDER_BOARD_PAGE_SIZE]
+        next_page_params = request.GET.copy()
+        next_page_params['cursor'] = encode_order_cursor(orders[-1])
+        next_page_url = f'?{next_page_params.urlencode()}'
+
+    return render(request, template_name='order_items.html', context={
+        'order_rows': [rendered_order['row'] for rendered_order in get_rendered_orders(orders)],
+        'order_filter': order_filter,
+        'first_page_url': first_page_url,
+        'next_page_url': next_page_url,
+        'restaurants_radius_km': settings.ORDER_RESTAURANTS_RADIUS_KM,
+        'changes_cursor': changes_cursor,
+        'changes_poll_interval': settings.ORDER_BOARD_POLL_INTERVAL,
+    })
+
+
+def get_changes_settled_at():
+    """
+    Time before which all changes of orders are committed.
+
+    `updated_at` is stamped before the transaction commits, so the order changed a bit earlier
+    may become visible after orders changed later. Cursor of changes doesn't go past this time,
+    recent changes are sent again until they are older than ORDER_BOARD_CHANGES_OVERLAP seconds.
+    """
+    return timezone.now() - timedelta(seconds=settings.ORDER_BOARD_CHANGES_OVERLAP)
+
+
+def get_order_changes(cursor):
+    """
+    Orders created or changed after the cursor, with restaurants and rendered rows of the order board.
+
+    Result has cursor for the next request, completed orders have no row, they should be removed from the board.
+    Orders changed during last ORDER_BOARD_CHANGES_OVERLAP seconds are left after the cursor and come again.
+    Raise ValueError if cursor is broken.
+    """
+    settled_at = get_changes_settled_at()
+    orders = Order.objects.all()
+    if cursor:
+        orders = orders.changed_after(*decode_changes_cursor(cursor))
+    else:
+        orders = orders.order_by('updated_at', 'id')
+
+    orders = load_order_rows(orders[:settings.ORDER_BOARD_CHANGES_LIMIT])
+    board_orders = [order for order in orders if order.status != Order.COMPLETED]
+    rendered_orders = dict(zip(
+        [order.id for order in board_orders],
+        get_rendered_orders(board_orders),
+    ))
+    changes = []
+    for order in orders:
+        rendered_order = rendered_orders.get(order.id, {'row': None, 'restaurants': []})
+        changes.append({
+            'id': order.id,
+            'status': order.status,
+            'updated_at': order.updated_at,
+            'is_on_board': order.id in rendered_orders,
+            'responsible_restaurant': order.responsible_restaurant_id,
+            'restaurants': rendered_order['restaurants'],
+            'row': rendered_order['row'],
+        })
+
+    settled_orders = [order for order in orders if order.updated_at <= settled_at]
+    return {
+        'orders': changes,
+        'cursor': encode_changes_cursor(settled_orders[-1]) if settled_orders else cursor or '',
+        # the cursor doesn't move when all orders are recent, they come again after the poll interval
+        'has_more': bool(settled_orders) and len(orders) == settings.ORDER_BOARD_CHANGES_LIMIT,
+    }
+
+
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def view_order_changes(request):
+    try:
+        return JsonResponse(get_order_changes(request.GET.get('since')))
+    except ValueError:
+        return JsonResponse({'error': 'Broken `since` cursor'}, status=400)
+
+
+def stream_order_changes(cursor):
+    started_at = time.monotonic()
+    # browser reconnects after the stream end
+    yield f'retry: {settings.ORDER_EVENTS_RETRY * 1000}\n\n'
+    last_event_id = order_events.last_event_id
+    # recent changes come again until they are settled, the same versions of orders are not sent twice
+    sent_changes = set()
+    while time.monotonic() - started_at < settings.ORDER_EVENTS_STREAM_TIMEOUT:
+        changes = get_order_changes(cursor)
+        cursor = changes['cursor']
+        new_changes = [order for order in changes['orders'] if (order['id'], order['updated_at']) not in sent_changes]
+        sent_changes = {(order['id'], order['updated_at']) for order in changes['orders']}
+        if new_changes:
+            changes['orders'] = new_changes
+            data = json.dumps(changes, cls=DjangoJSONEncoder)
+            yield f'id: {cursor}\nevent: orders\ndata: {data}\n\n'
+        else:
+            # comment keeps connection alive
+            yield ': ping\n\n'
+        if changes['has_more']:
+            continue
+        # changes from other processes are found by polling db after timeout
+        last_event_id = order_events.wait(last_event_id, timeout=settings.ORDER_EVENTS_POLL_INTERVAL)
+
+
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def view_order_events(request):
+    """Server-Sent Events stream of created and changed orders, data of events is the same as of order changes."""
+    cursor = request.headers.get('Last-Event-ID') or request.GET.get('since')
+    try:
+        if cursor:
+            decode_changes_cursor(cursor)
+    except ValueError:
+        return JsonResponse({'error': 'Broken `since` cursor'}, status=400)
+
+    response = StreamingHttpResponse(stream_order_changes(cursor), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # nginx should send events at once
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,6 +1,7 @@
 import os
 
 import dj_database_url
+from django.core.exceptions import ImproperlyConfigured
 
 from environs import Env
 
@@ -13,6 +14,65 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 SECRET_KEY = env('SECRET_KEY')
 DEBUG = env.bool('DEBUG', True)
 YANDEX_GEO_APIKEY = env.str('YANDEX_GEO_APIKEY')
+ORDER_BOARD_PAGE_SIZE = env.int('ORDER_BOARD_PAGE_SIZE', 50)
+# order board asks for changed orders every ORDER_BOARD_POLL_INTERVAL seconds
+ORDER_BOARD_POLL_INTERVAL = env.int('ORDER_BOARD_POLL_INTERVAL', 10)
+ORDER_BOARD_CHANGES_LIMIT = env.int('ORDER_BOARD_CHANGES_LIMIT', 100)
+# changes of last ORDER_BOARD_CHANGES_OVERLAP seconds are sent again, so changes committed later than they are stamped
+# are not missed, should be longer than the longest transaction changing orders
+ORDER_BOARD_CHANGES_OVERLAP = env.int('ORDER_BOARD_CHANGES_OVERLAP', 5)
+# rendered rows of order board are kept in cache for ORDER_ROW_CACHE_TTL seconds
+ORDER_ROW_CACHE_TTL = env.int('ORDER_ROW_CACHE_TTL', 24 * 60 * 60)
+# serialized product catalog is kept in cache for CATALOG_CACHE_TTL seconds,
+# browsers may use it for CATALOG_MAX_AGE seconds without asking the server
+CATALOG_CACHE_TTL = env.int('CATALOG_CACHE_TTL', 24 * 60 * 60)
+CATALOG_MAX_AGE = env.int('CATALOG_MAX_AGE', 60)
+# client can't ask for more than CATALOG_PAGE_SIZE_MAX products on one page of catalog
+CATALOG_PAGE_SIZE_MAX = env.int('CATALOG_PAGE_SIZE_MAX', 100)
+# partners can send up to ORDER_BATCH_MAX_SIZE orders in one request
+ORDER_BATCH_MAX_SIZE = env.int('ORDER_BATCH_MAX_SIZE', 100)
+# response to order registration with Idempotency-Key is replayed to retries for IDEMPOTENCY_KEY_TTL seconds
+IDEMPOTENCY_KEY_TTL = env.int('IDEMPOTENCY_KEY_TTL', 24 * 60 * 60)
+# key of request not finished in IDEMPOTENCY_KEY_LOCK_TIMEOUT seconds can be taken by retry, e.g. if process was killed
+IDEMPOTENCY_KEY_LOCK_TIMEOUT = env.int('IDEMPOTENCY_KEY_LOCK_TIMEOUT', 60)
+# with ORDER_INTAKE_GROUP_COMMIT orders are committed in groups by background thread of every process,
+# group is committed when it has ORDER_INTAKE_BATCH_SIZE orders or ORDER_INTAKE_FLUSH_INTERVAL ms after its first order
+ORDER_INTAKE_GROUP_COMMIT = env.bool('ORDER_INTAKE_GROUP_COMMIT', False)
+ORDER_INTAKE_BATCH_SIZE = env.int('ORDER_INTAKE_BATCH_SIZE', 20)
+ORDER_INTAKE_FLUSH_INTERVAL = env.float('ORDER_INTAKE_FLUSH_INTERVAL', 5.0)
+# request gets 503 if its order is not taken for commit in ORDER_INTAKE_TIMEOUT seconds, order taken already is waited for
+ORDER_INTAKE_TIMEOUT = env.float('ORDER_INTAKE_TIMEOUT', 10.0)
+# stream of order events checks db every ORDER_EVENTS_POLL_INTERVAL seconds for changes from other processes,
+# it's closed after ORDER_EVENTS_STREAM_TIMEOUT seconds and browser reconnects after ORDER_EVENTS_RETRY seconds
+ORDER_EVENTS_POLL_INTERVAL = env.int('ORDER_EVENTS_POLL_INTERVAL', 3)
+ORDER_EVENTS_STREAM_TIMEOUT = env.int('ORDER_EVENTS_STREAM_TIMEOUT', 60)
+ORDER_EVENTS_RETRY = env.int('ORDER_EVENTS_RETRY', 1)
+# order board shows only ORDER_RESTAURANTS_LIMIT nearest restaurants not farther than ORDER_RESTAURANTS_RADIUS_KM
+ORDER_RESTAURANTS_LIMIT = env.int('ORDER_RESTAURANTS_LIMIT', 5)
+ORDER_RESTAURANTS_RADIUS_KM = env.float('ORDER_RESTAURANTS_RADIUS_KM', 50.0)
+# size of cell of the restaurants grid used for the nearest restaurants lookup
+RESTAURANT_INDEX_CELL_KM = env.float('RESTAURANT_INDEX_CELL_KM', 2.0)
+# index with restaurants of unknown coordinates is rebuilt after RESTAURANT_INDEX_UNKNOWN_TTL seconds
+RESTAURANT_INDEX_UNKNOWN_TTL = env.int('RESTAURANT_INDEX_UNKNOWN_TTL', 60)
+# class of geocoder client and url of its API, can be replaced with a local stub
+GEOCODER_BACKEND = env.str('GEOCODER_BACKEND', 'restaurateur.geocoder.YandexGeocoder')
+GEOCODER_URL = env.str('GEOCODER_URL', 'https://geocode-maps.yandex.ru/1.x')
+GEOCODER_CONNECT_TIMEOUT = env.float('GEOCODER_CONNECT_TIMEOUT', 1.0)
+GEOCODER_READ_TIMEOUT = env.float('GEOCODER_READ_TIMEOUT', 3.0)
+GEOCODER_RETRIES = env.int('GEOCODER_RETRIES', 2)
+# geocoder is not requested for GEOCODER_CIRCUIT_RESET_TIMEOUT seconds after GEOCODER_CIRCUIT_FAILURES failures in a row
+GEOCODER_CIRCUIT_FAILURES = env.int('GEOCODER_CIRCUIT_FAILURES', 5)
+GEOCODER_CIRCUIT_RESET_TIMEOUT = env.float('GEOCODER_CIRCUIT_RESET_TIMEOUT', 30.0)
+# time budget (seconds) for geocoding of unknown addresses while rendering the manager order board
+GEOCODER_TIMEOUT = env.float('GEOCODER_TIMEOUT', 3.0)
+GEOCODER_MAX_WORKERS = env.int('GEOCODER_MAX_WORKERS', 10)
+# coordinates cache in memory of process and in django cache
+GEOCODER_CACHE_SIZE = env.int('GEOCODER_CACHE_SIZE', 10000)
+GEOCODER_CACHE_TTL = env.int('GEOCODER_CACHE_TTL', 60 * 60)
+# addresses unknown for geocoder are asked again after this time
+GEOCODER_NEGATIVE_CACHE_TTL = env.int('GEOCODER_NEGATIVE_CACHE_TTL', 10 * 60)
+# coordinates in db older than this are geocoded again in background
+ADDRESS_COORDINATES_TTL = env.int('ADDRESS_COORDINATES_TTL', 30 * 24 * 60 * 60)
 ROLLBAR_POST_SERVER_ITEM_ACCESS_TOKEN = env.str('ROLLBAR_POST_SERVER_ITEM_ACCESS_TOKEN')
 ROLLBAR_ENVIRONMENT_NAME = env.str('ROLLBAR_ENVIRONMENT_NAME', 'development')
 POSTGRES_DB_URL = env.str('POSTGRES_DB_URL')
@@ -99,6 +159,14 @@ DATABASES = {
     'default': dj_database_url.config(default=POSTGRES_DB_URL)
 }
 
+# cache should be shared by gunicorn workers in production, e.g. `db://django_cache` or memcached,
+# cache versions bumped by one worker are not seen by the others with cache in memory of process
+CACHES = {
+    'default': env.dj_cache_url('CACHE_URL', 'locmem://' if DEBUG else 'db://django_cache'),
+}
+if not DEBUG and CACHES['default']['BACKEND'] == 'django.core.cache.backends.locmem.LocMemCache':
+    raise ImproperlyConfigured('CACHE_URL should be shared by processes when DEBUG is off, e.g. db://django_cache')
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',